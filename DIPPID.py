@@ -1,16 +1,56 @@
 import sys
 import json
+from collections import deque
 from threading import Thread
-from time import sleep
+from time import sleep, monotonic
 from datetime import datetime
 import signal
 
+# binary message format next to json (same directory, standard library only)
+import dippid_wire
+
 # those modules are imported dynamically during runtime
 # they are imported only if the corresponding class is used
 #import socket
+#import asyncio
 #import serial
 #import wiimote
 
+# SensorUDP reads at most this many waiting datagrams before it dispatches them
+MAX_DRAIN_DATAGRAMS = 256
+# every value of these is dispatched (tap 1 / 0, gestures), of all other capabilities
+# (e.g. movement) only the newest one between two edges
+EDGE_CAPABILITIES = ('tap', 'gesture')
+# touch messages are edges too, except for moves, those are merged per contact id
+TOUCH_EDGE_STATES = ('down', 'up')
+# updates that may wait in the dispatch queue (see Sensor.use_dispatch_queue)
+DISPATCH_QUEUE_SIZE = 1024
+
+# what a value is merged by, None for edges
+def _coalesce_key(key, value):
+    if key in EDGE_CAPABILITIES:
+        return None
+    if key == 'touch':
+        if not isinstance(value, dict) or value.get('state') in TOUCH_EDGE_STATES:
+            return None
+        return (key, value.get('id'))
+    return key
+
+# drops every non-edge value that is followed by a newer one with the same key before
+# the next edge, so a tap still sees the position it was sent at.
+# items are tuples that start with the capability and its value
+def _coalesce(items):
+    pending = {}
+    for item in items:
+        merge_key = _coalesce_key(item[0], item[1])
+        if merge_key is None:
+            yield from pending.values()
+            pending.clear()
+            yield item
+        else:
+            pending[merge_key] = item
+    yield from pending.values()
+
 class Sensor():
     # class variable that stores all instances of Sensor
     instances = []
@@ -22,12 +62,22 @@ class Sensor():
         self._callbacks = {}
         # for each capability, store the last value as an object
         self._data = {}
+        # for each capability, the sender's capture time (its time.monotonic()) of the last value
+        # (only known for binary messages, None for json)
+        self._timestamps = {}
         self._receiving = False
+        # None: callbacks are called on the receiving thread
+        self._dispatch_queue = None
+        # updates that were dropped because the queue was full (the oldest ones)
+        self.queue_overflows = 0
         Sensor.instances.append(self)
 
     # stops the loop in _receive() and kills the thread
     # so the program can terminate smoothly
     def disconnect(self):
+        # may be called again, e.g. by the ctrl+c handler
+        if self not in Sensor.instances:
+            return
         self._receiving = False
         Sensor.instances.remove(self)
         if self._connection_thread:
@@ -37,24 +87,30 @@ class Sensor():
     # receives json formatted data from sensor,
     # stores it and notifies callbacks
     def _update(self, data):
+        for key, value in self._parse_json(data).items():
+            self._set_value(key, value)
+
+    def _parse_json(self, data):
         try:
-            data_json = json.loads(data)
+            return json.loads(data)
         except json.decoder.JSONDecodeError:
             # incomplete data
-            return
+            return {}
 
-        for key, value in data_json.items():
-            self._add_capability(key)
+    # stores one value and notifies callbacks if it has changed
+    def _set_value(self, key, value, timestamp=None):
+        self._add_capability(key)
+        self._timestamps[key] = timestamp
 
-            # do not notify callbacks on initialization
-            if self._data[key] == []:
-                self._data[key] = value
-                continue
+        # do not notify callbacks on initialization
+        if self._data[key] == []:
+            self._data[key] = value
+            return
 
-            # notify callbacks only if data has changed
-            if self._data[key] != value:
-                self._data[key] = value
-                self._notify_callbacks(key)
+        # notify callbacks only if data has changed
+        if self._data[key] != value:
+            self._data[key] = value
+            self._notify_callbacks(key)
 
     # checks if capability is available
     def has_capability(self, key):
@@ -79,6 +135,18 @@ class Sensor():
             #raise KeyError(f'"{key}" is not a capability of this sensor.')
             return None
 
+    # capture time of the last value as sent by the sensor, None if unknown
+    def get_timestamp(self, key):
+        return self._timestamps.get(key)
+
+    # seconds since the last value was captured, None if unknown. the tracker stamps its
+    # frames with time.monotonic(), so this only works on the machine the tracker runs on
+    def get_age(self, key):
+        timestamp = self._timestamps.get(key)
+        if timestamp is None:
+            return None
+        return monotonic() - timestamp
+
     # register a callback function for a change in specified capability
     def register_callback(self, key, func):
         self._add_capability(key)
@@ -93,7 +161,38 @@ class Sensor():
             # in case somebody wants to check if the callback was present before
             return False
 
+    # callbacks are no longer called on the receiving thread, updates are queued instead
+    # and dispatch_pending() calls them on the thread of the application, e.g. with
+    # pyglet.clock.schedule(sensor.dispatch_pending) once per frame.
+    # the queue is a deque (append and popleft are atomic, no lock needed); only the
+    # receiving thread appends, so the overflow check does not race
+    def use_dispatch_queue(self, max_size=DISPATCH_QUEUE_SIZE):
+        self._dispatch_queue = deque(maxlen=max_size)
+
+    # number of updates waiting for dispatch_pending()
+    @property
+    def queue_depth(self):
+        return 0 if self._dispatch_queue is None else len(self._dispatch_queue)
+
+    # takes everything queued so far and calls the callbacks, merged like the datagrams
+    # of one wakeup: every edge, otherwise only the newest value between two edges, so
+    # the callbacks per frame do not grow with the packet rate.
+    # dt is ignored, it is only there for pyglet.clock.schedule
+    def dispatch_pending(self, dt=None):
+        queue = self._dispatch_queue
+        if queue is None:
+            return
+        updates = [queue.popleft() for _ in range(len(queue))]
+        for key, value in _coalesce(updates):
+            for func in self._callbacks[key]:
+                func(value)
+
     def _notify_callbacks(self, key):
+        if self._dispatch_queue is not None:
+            if len(self._dispatch_queue) == self._dispatch_queue.maxlen:
+                self.queue_overflows += 1
+            self._dispatch_queue.append((key, self._data[key]))
+            return
         for func in self._callbacks[key]:
             func(self._data[key])
 
@@ -101,11 +200,22 @@ class Sensor():
 # initialized with a UDP port
 # listens to all IPs by default
 # requires the socket module
+# understands json and the binary format of dippid_wire.py, for binary messages
+# lost_packets counts gaps in the sequence numbers and stale_packets the messages
+# that arrived after a newer one (those are dropped).
+# after every wakeup the receiver thread also reads everything else that is already
+# waiting and merges it (see EDGE_CAPABILITIES), so callbacks never work through old
+# positions after a burst. coalesced_packets counts the values that were skipped
 class SensorUDP(Sensor):
     def __init__(self, port, ip='0.0.0.0'):
         Sensor.__init__(self)
         self._ip = ip
         self._port = port
+        # last sequence number per sender address
+        self._sequences = {}
+        self.lost_packets = 0
+        self.stale_packets = 0
+        self.coalesced_packets = 0
         self._connect()
 
     def _connect(self):
@@ -124,11 +234,104 @@ class SensorUDP(Sensor):
                 data, addr = self._sock.recvfrom(1024)
             except TimeoutError:
                 continue
+            datagrams = [(data, addr)]
+            self._sock.settimeout(0.0)
             try:
-                data_decoded = data.decode()
-            except UnicodeDecodeError:
-                continue
-            self._update(data_decoded)
+                while len(datagrams) < MAX_DRAIN_DATAGRAMS:
+                    datagrams.append(self._sock.recvfrom(1024))
+            except BlockingIOError:
+                # nothing more waiting
+                pass
+            finally:
+                self._sock.settimeout(0.1)
+            self._handle_datagrams(datagrams)
+
+    def _handle_datagram(self, data, addr):
+        self._handle_datagrams([(data, addr)])
+
+    def _handle_datagrams(self, datagrams):
+        updates = [update for data, addr in datagrams
+                   for update in self._decode_datagram(data, addr)]
+        merged = list(_coalesce(updates))
+        self.coalesced_packets += len(updates) - len(merged)
+        for key, value, timestamp in merged:
+            self._set_value(key, value, timestamp)
+
+    # [(capability, value, timestamp)] of one datagram
+    def _decode_datagram(self, data, addr):
+        if dippid_wire.is_binary(data):
+            return self._decode_binary(data, addr)
+        try:
+            data_decoded = data.decode()
+        except UnicodeDecodeError:
+            return []
+        return [(key, value, None) for key, value in self._parse_json(data_decoded).items()]
+
+    def _decode_binary(self, data, addr):
+        message = dippid_wire.decode_message(data)
+        if message is None:
+            return []
+        key, value, sequence, timestamp = message
+
+        last_sequence = self._sequences.get(addr)
+        if last_sequence is not None:
+            gap = dippid_wire.sequence_gap(last_sequence, sequence)
+            if gap is None:
+                self.stale_packets += 1
+                return []
+            self.lost_packets += gap
+        self._sequences[addr] = sequence
+        return [(key, value, timestamp)]
+
+# same as SensorUDP, but without a thread: the socket is handled by the asyncio event
+# loop of the application, so callbacks run on that loop's thread the moment a packet
+# arrives and disconnect() returns immediately.
+# the port is bound in the constructor, receiving starts with "await sensor.start()"
+# requires the socket and asyncio modules
+class SensorAsyncUDP(SensorUDP):
+    def _connect(self):
+        import socket
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self._ip, self._port))
+        self._sock.setblocking(False)
+        self._connection_thread = None
+        self._transport = None
+
+    async def start(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), sock=self._sock)
+        self._receiving = True
+
+    def disconnect(self):
+        if self not in Sensor.instances:
+            return
+        if self._transport is not None:
+            self._transport.close()
+        else:
+            self._sock.close()
+        Sensor.disconnect(self)
+
+# passes the datagrams of the asyncio transport on to the sensor
+class _DatagramProtocol():
+    def __init__(self, sensor):
+        self._sensor = sensor
+
+    def connection_made(self, transport):
+        pass
+
+    def datagram_received(self, data, addr):
+        self._sensor._handle_datagram(data, addr)
+
+    def error_received(self, exc):
+        # e.g. ICMP port unreachable, the next datagram may arrive anyway
+        pass
+
+    def connection_lost(self, exc):
+        self._sensor._receiving = False
 
 # sensor connected via serial connection (USB)
 # initialized with a path to a TTY (e.g. /dev/ttyUSB0)
@@ -0,0 +1,51 @@
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from background_model import BACKGROUND_MAX_THRESHOLD, BACKGROUND_THRESHOLD_SIGMAS
+
+#calibrated backgrounds, one file per camera, resolution and orientation
+CACHE_DIR= Path(".cache") / "backgrounds"
+#a stored background is only used if a fresh frame differs from it in less than this
+#fraction of the pixels (camera moved, box opened, other light)
+WARM_START_MAX_CHANGED_FRACTION= 0.02
+
+
+def background_path(camera, frame_size, mirror) -> Path:
+    camera_name = re.sub(r"[^A-Za-z0-9]+", "_", str(camera))
+    width, height = frame_size
+    return CACHE_DIR / f"camera_{camera_name}_{width}x{height}{'_mirror' if mirror else ''}.npz"
+
+
+#returns (mean, variance) or None if there is no usable file
+def load_background(path: Path):
+    try:
+        with np.load(path) as stored:
+            mean, variance = stored["mean"], stored["variance"]
+    except (OSError, KeyError, ValueError):
+        return None
+    if mean.shape != variance.shape:
+        return None
+    return mean.astype(np.float32), variance.astype(np.float32)
+
+
+def save_background(path: Path, mean, variance):
+    path.parent.mkdir(parents= True, exist_ok= True)
+    #a crash while writing must not leave a broken file behind
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as tmp_file:
+        np.savez(tmp_file, mean= mean, variance= variance)
+    os.replace(tmp_path, path)
+
+
+#quick check of one gray frame against a stored background: brighter or darker than
+#the per pixel threshold counts as changed
+def background_matches(mean, variance, gray, min_threshold) -> bool:
+    if gray.shape != mean.shape:
+        return False
+    threshold = np.clip(BACKGROUND_THRESHOLD_SIGMAS * np.sqrt(variance),
+                        min_threshold, BACKGROUND_MAX_THRESHOLD)
+    changed = np.abs(gray - mean) > threshold
+    return changed.mean() < WARM_START_MAX_CHANGED_FRACTION
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+#the threshold of every pixel is this many standard deviations of its own noise,
+#but at least min_threshold and at most BACKGROUND_MAX_THRESHOLD
+BACKGROUND_THRESHOLD_SIGMAS= 5.0
+BACKGROUND_MAX_THRESHOLD= 60
+#the image is split into this many horizontal bands, one band is learned per update,
+#so every pixel is updated every BACKGROUND_UPDATE_TILES frames without a finger
+BACKGROUND_UPDATE_TILES= 4
+
+
+#running mean and variance of every background pixel in preallocated float32 buffers.
+#a pixel belongs to the finger when it is darker than its mean by more than its own
+#threshold, so noisy or unevenly lit parts of the surface need a larger difference.
+#mean_uint8 and threshold_uint8 are kept up to date for the detection
+class BackgroundModel:
+    def __init__(self, mean, variance, learning_rate, min_threshold,
+                 sigmas=BACKGROUND_THRESHOLD_SIGMAS, max_threshold=BACKGROUND_MAX_THRESHOLD,
+                 tiles=BACKGROUND_UPDATE_TILES):
+        self.mean = np.array(mean, dtype=np.float32)
+        self.variance = np.array(variance, dtype=np.float32)
+        self.mean_uint8 = np.empty(self.mean.shape, np.uint8)
+        self.threshold_uint8 = np.empty(self.mean.shape, np.uint8)
+        self._min_threshold = min_threshold
+        self._max_threshold = max_threshold
+        self._sigmas = sigmas
+
+        height = self.mean.shape[0]
+        self._tiles = max(1, min(int(tiles), height))
+        bounds = np.linspace(0, height, self._tiles + 1).astype(int)
+        self._bands = [slice(bounds[i], bounds[i + 1]) for i in range(self._tiles)]
+        self._next_band = 0
+        #every band waits tiles updates for its turn, it learns that much faster
+        self._rate = 1 - (1 - learning_rate) ** self._tiles
+
+        self._difference = np.empty(self.mean.shape, np.float32)
+        self._scratch = np.empty(self.mean.shape, np.float32)
+        self._mask = np.empty(self.mean.shape, np.uint8)
+        self._darkness = np.empty(self.mean.shape, np.uint8)
+        self._refresh(slice(None))
+
+    def _refresh(self, band):
+        cv2.convertScaleAbs(self.mean[band], self.mean_uint8[band])
+        cv2.sqrt(self.variance[band], self._scratch[band])
+        threshold = self.threshold_uint8[band]
+        cv2.convertScaleAbs(self._scratch[band], threshold, self._sigmas)
+        np.clip(threshold, self._min_threshold, self._max_threshold, out=threshold)
+
+    #learns the next band of a frame without a finger
+    def update(self, gray):
+        band = self._bands[self._next_band]
+        self._next_band = (self._next_band + 1) % self._tiles
+
+        #exponentially weighted variance of the difference to the old mean, then the mean
+        difference = self._difference[band]
+        cv2.subtract(gray[band], self.mean[band], difference, dtype=cv2.CV_32F)
+        cv2.multiply(difference, difference, difference)
+        cv2.accumulateWeighted(difference, self.variance[band], self._rate)
+        cv2.accumulateWeighted(gray[band], self.mean[band], self._rate)
+        self._refresh(band)
+
+    #how much darker than the background every pixel is, and the mask of the pixels
+    #above their threshold. both arrays are reused by the next call
+    def difference(self, gray):
+        cv2.subtract(self.mean_uint8, gray, self._darkness)
+        cv2.compare(self._darkness, self.threshold_uint8, cv2.CMP_GT, self._mask)
+        return self._darkness, self._mask
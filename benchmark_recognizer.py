@@ -0,0 +1,175 @@
+#benchmark for the letter recognizers, runs without camera and display:
+#python benchmark_recognizer.py --sizes 26 104 416 --output bench.json
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import recognizer as recognizer_module
+from cloud_recognizer import PointCloudRecognizer
+from template_cache import load_templates
+
+TEMPLATE_DIR= Path("letter_templates")
+WINDOW_H= 1000
+
+#distortions applied to the template strokes to get test strokes
+SCALE_RANGE= (0.6, 1.6)
+ASPECT_RANGE= (0.85, 1.15)
+ROTATION_DEGREES= 15.0
+NOISE_FRACTION= 0.02
+JITTER_FRACTION= 0.01
+DROPOUT_FRACTION= 0.2
+
+#extra templates (to grow the library) come from another distortion model than the
+#test strokes, otherwise they are near copies of the test strokes and the accuracy
+#grows with the library for the wrong reason: a shear and a smooth bend along the stroke
+TEMPLATE_SHEAR= 0.25
+TEMPLATE_BEND_FRACTION= 0.06
+TEMPLATE_BEND_WAVES= (0.5, 2.0)
+
+ENGINES= ("dollar", "protractor", "cloud")
+
+
+#returns a distorted copy of a template stroke: scaled, rotated, with a slowly
+#drifting noise, per point jitter and randomly dropped points
+def synthesize_stroke(raw_points, rng, strength= 1.0):
+    pts = np.asarray(raw_points, dtype=np.float64)
+    size = max(np.ptp(pts, axis=0).max(), 1.0)
+    center = pts.mean(axis=0)
+
+    scale = rng.uniform(*SCALE_RANGE) ** strength
+    aspect = rng.uniform(*ASPECT_RANGE) ** strength
+    angle = math.radians(rng.uniform(-ROTATION_DEGREES, ROTATION_DEGREES) * strength)
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    rotation = np.array([[cos_a, -sin_a], [sin_a, cos_a]])
+
+    pts = ((pts - center) * (scale * aspect, scale / aspect)) @ rotation.T + center
+    drift = np.cumsum(rng.normal(0, NOISE_FRACTION * size * strength, pts.shape), axis=0)
+    pts += drift / math.sqrt(len(pts))
+    pts += rng.normal(0, JITTER_FRACTION * size * strength, pts.shape)
+
+    keep = rng.random(len(pts)) >= DROPOUT_FRACTION * strength
+    keep[[0, -1]] = True
+    return pts[keep]
+
+
+#another writer's version of a template stroke: sheared and bent sideways by a sine
+#along the stroke, no noise, no dropped points
+def vary_template(raw_points, rng):
+    pts = np.asarray(raw_points, dtype=np.float64)
+    size = max(np.ptp(pts, axis=0).max(), 1.0)
+    center = pts.mean(axis=0)
+
+    shear = np.array([[1.0, rng.uniform(-TEMPLATE_SHEAR, TEMPLATE_SHEAR)], [0.0, 1.0]])
+    pts = (pts - center) @ shear.T + center
+
+    steps = np.hypot(*np.diff(pts, axis=0).T)
+    arc = np.concatenate(([0.0], np.cumsum(steps))) / max(steps.sum(), 1.0)
+    waves = rng.uniform(*TEMPLATE_BEND_WAVES)
+    phase = rng.uniform(0, 2 * math.pi)
+    bend = TEMPLATE_BEND_FRACTION * size * np.sin(2 * math.pi * waves * arc + phase)
+    direction = rng.normal(size=2)
+    return pts + bend[:, None] * direction / np.linalg.norm(direction)
+
+
+#the recognizers expect camera coordinates (y pointing down)
+def to_camera(pts):
+    return [(x, WINDOW_H - y) for x, y in pts]
+
+
+def build_engine(engine, names, raw_points, size, rng):
+    if engine == "cloud":
+        rec = PointCloudRecognizer(window_h= WINDOW_H)
+        add = lambda name, pts: rec.add_template(name, [pts])
+    else:
+        rec = recognizer_module.DollarRecognizer(window_h= WINDOW_H,
+                                                 protractor= engine == "protractor")
+        add = rec.add_template
+
+    for i in range(size):
+        name, raw = names[i % len(names)], raw_points[i % len(names)]
+        add(name, raw if i < len(names) else vary_template(raw, rng))
+    return rec
+
+
+def run_case(engine, names, raw_points, size, samples, seed):
+    #the test strokes only depend on the seed, so every engine and template
+    #count is measured on the same strokes
+    rec = build_engine(engine, names, raw_points, size, np.random.default_rng(seed + 1))
+    rng = np.random.default_rng(seed)
+    latencies = []
+    correct = 0
+    for _ in range(samples):
+        for name, raw in zip(names, raw_points):
+            stroke = to_camera(synthesize_stroke(raw, rng))
+            if engine == "cloud":
+                stroke = [stroke]
+            start = time.perf_counter()
+            res = rec.recognize(stroke)
+            latencies.append(time.perf_counter() - start)
+            correct += res.name == name
+
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "engine": engine,
+        "templates": size,
+        "strokes": len(latencies),
+        "accuracy": correct / len(latencies),
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(latencies_ms.max()),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description= "Accuracy and latency of the letter recognizers")
+    parser.add_argument("--sizes", type= int, nargs= "+", default= [26, 104, 416],
+                        help= "template counts, letters are repeated with variations")
+    parser.add_argument("--samples", type= int, default= 5,
+                        help= "test strokes per letter and template count")
+    parser.add_argument("--engines", nargs= "+", choices= ENGINES, default= list(ENGINES))
+    parser.add_argument("--seed", type= int, default= 0)
+    parser.add_argument("--output", type= Path,
+                        help= "write the json report to this file instead of stdout")
+    args = parser.parse_args()
+
+    names, _, raw_points = load_templates(TEMPLATE_DIR)
+    if not names:
+        sys.exit(f"Keine Templates in {TEMPLATE_DIR} gefunden")
+
+    results = []
+    for engine in args.engines:
+        for size in args.sizes:
+            case = run_case(engine, names, raw_points, size, args.samples, args.seed)
+            results.append(case)
+            print(f"{engine:>10} {size:>5} templates: "
+                  f"{case['accuracy'] * 100:5.1f}% "
+                  f"p50 {case['latency_ms']['p50']:.2f} ms "
+                  f"p99 {case['latency_ms']['p99']:.2f} ms", file= sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "samples_per_letter": args.samples,
+        "results": results,
+    }
+    text = json.dumps(report, indent= 2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
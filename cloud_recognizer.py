@@ -0,0 +1,131 @@
+#BASIERT AUF https://depts.washington.edu/acelab/proj/dollar/pdollar.js
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from recognizer import Result
+
+NUM_CLOUD_POINTS = 32
+#the greedy matching starts at every STEP-th point (n ^ (1 - epsilon) with epsilon = 0.5)
+CLOUD_STEP       = int(math.floor(NUM_CLOUD_POINTS ** 0.5))
+
+Stroke = Sequence[Tuple[float, float]]
+
+
+#resamples all strokes of a gesture together to n points, spread evenly over the summed
+#length of the strokes. the jumps between strokes do not count as path
+def resample_strokes(strokes: Sequence[Stroke], n: int = NUM_CLOUD_POINTS) -> np.ndarray:
+    strokes = [np.asarray(s, dtype=np.float64).reshape(-1, 2) for s in strokes]
+    strokes = [s for s in strokes if len(s)]
+    if not strokes:
+        return np.empty((0, 2))
+
+    starts = np.concatenate([s[:-1] for s in strokes])
+    ends = np.concatenate([s[1:] for s in strokes])
+    lengths = np.hypot(*(ends - starts).T)
+    moving = lengths > 0
+    if not moving.any():
+        return np.repeat(strokes[0][:1], n, axis=0)
+
+    starts, ends, lengths = starts[moving], ends[moving], lengths[moving]
+    seg_end = np.cumsum(lengths)
+    targets = np.linspace(0.0, seg_end[-1], n)
+    seg = np.minimum(np.searchsorted(seg_end, targets), len(seg_end) - 1)
+    frac = (targets - (seg_end[seg] - lengths[seg])) / lengths[seg]
+    return starts[seg] + frac[:, None] * (ends[seg] - starts[seg])
+
+
+#$P keeps the aspect ratio, so the gesture is scaled uniformly into the unit square
+def normalize_cloud(pts: np.ndarray) -> np.ndarray:
+    lo = pts.min(axis=0)
+    size = (pts.max(axis=0) - lo).max() or 1.0
+    pts = (pts - lo) / size
+    return pts - pts.mean(axis=0)
+
+
+def preprocess_cloud(strokes: Sequence[Stroke]) -> np.ndarray:
+    return normalize_cloud(resample_strokes(strokes))
+
+
+#greedy cloud matching of one candidate against all templates at once. every template,
+#start point and direction is one row of the batch, the n matching steps are the only loop
+def cloud_distances(pts: np.ndarray, tmpl_stack: np.ndarray,
+                    step: int = CLOUD_STEP) -> np.ndarray:
+    count, n, _ = tmpl_stack.shape
+    starts = np.arange(0, n, step)
+
+    #(T, n, n) distances from every candidate point to every template point and back
+    forward = np.linalg.norm(pts[None, :, None] - tmpl_stack[:, None], axis=-1)
+    pairs = np.concatenate((forward, forward.transpose(0, 2, 1)))
+    rows = np.repeat(np.arange(2 * count), len(starts))
+    first = np.tile(starts, 2 * count)
+
+    matched = np.zeros((len(rows), n), dtype=bool)
+    totals = np.zeros(len(rows))
+    batch = np.arange(len(rows))
+    for k in range(n):
+        i = (first + k) % n
+        d = np.where(matched, np.inf, pairs[rows, i])
+        j = d.argmin(axis=1)
+        #points matched early weigh more, like in the javascript version
+        weight = 1.0 - k / n
+        totals += weight * d[batch, j]
+        matched[batch, j] = True
+
+    return totals.reshape(2, count, len(starts)).min(axis=(0, 2))
+
+
+@dataclass
+class CloudTemplate:
+    name   : str
+    strokes: List[Stroke]
+    points : np.ndarray = None
+
+    def __post_init__(self):
+        if self.points is None:
+            self.points = preprocess_cloud(self.strokes)
+
+
+#point cloud recognizer for gestures made of several strokes, with the same
+#add_template/recognize interface as DollarRecognizer. stroke order and direction
+#do not matter, but unlike $1 the gestures are not rotation invariant
+class PointCloudRecognizer:
+    def __init__(self, window_h: int):
+        self.templates: List[CloudTemplate] = []
+        self._win_h = window_h
+        self._template_stack: np.ndarray = None
+
+    def add_template(self, name: str, strokes: List[Stroke]):
+        self.templates.append(CloudTemplate(name, strokes))
+        self._template_stack = None
+
+    @property
+    def template_stack(self) -> np.ndarray:
+        if self._template_stack is None:
+            self._template_stack = np.stack(
+                [t.points for t in self.templates]
+            ) if self.templates else np.empty((0, NUM_CLOUD_POINTS, 2))
+        return self._template_stack
+
+    def recognize(self, strokes: List[Stroke], n_best: int = 1) -> Result:
+        if not self.templates:
+            return Result("No match", float("-inf"))
+
+        #reverse y for pyglet window since it measures from bottom
+        flipped = [np.asarray(s, dtype=np.float64).reshape(-1, 2) * (1, -1) + (0, self._win_h)
+                   for s in strokes]
+        dists = cloud_distances(preprocess_cloud(flipped), self.template_stack)
+
+        #best distance per name, like DollarRecognizer.recognize
+        name_dists = {}
+        for tmpl, d in zip(self.templates, dists):
+            if d < name_dists.get(tmpl.name, np.inf):
+                name_dists[tmpl.name] = d
+        ranked = sorted(name_dists.items(), key=lambda item: item[1])[:max(1, n_best)]
+        results = [Result(name, float(1.0 / d if d > 1.0 else 1.0)) for name, d in ranked]
+        best = results[0]
+        return Result(best.name, best.score, results)
@@ -0,0 +1,102 @@
+import threading
+
+import cv2
+import numpy as np
+
+#the preview is only refreshed this often, the tracker itself runs at camera speed
+PREVIEW_MAX_FPS= 15
+ESC_KEY= 27
+#one image waiting, one being worked on and one the other thread is using
+SNAPSHOT_BUFFERS= 3
+
+
+#a buffer shaped like the given image that is not in busy
+def _free_buffer(buffers, like, busy):
+    for i, buffer in enumerate(buffers):
+        if buffer is not None and any(buffer is other for other in busy):
+            continue
+        if buffer is None or buffer.shape[:2] != like.shape[:2] or buffer.dtype != like.dtype:
+            buffer = buffers[i] = np.empty_like(like)
+        return buffer
+
+
+#debug window of the tracker. the tracker asks due() first and only then copies the
+#frame into snapshot_buffer() and draws its overlays on it. resizing runs on a worker
+#thread, imshow and waitKey stay on the calling (main) thread in show(), which the
+#tracker calls every frame: HighGUI windows (calibration, LettersWindow) must all be
+#used from one thread, and on some platforms (macOS) that has to be the main thread.
+#the buffers and the resized window images are reused, nothing is allocated per image.
+#closed is set once ESC was pressed in any window
+class DebugPreview:
+    def __init__(self, title, size, max_fps=PREVIEW_MAX_FPS):
+        self._title = title
+        self._size = size
+        self._interval = 1.0 / max_fps
+        self._next_time = 0.0
+        self._snapshot = None
+        self._resizing = None
+        self._buffers = [None] * SNAPSHOT_BUFFERS
+        self._ready = None
+        self._displaying = None
+        self._displays = [None] * SNAPSHOT_BUFFERS
+        self._display_like = np.empty((size[1], size[0], 3), np.uint8)
+        self.closed = False
+        self._shown = False
+
+        self._lock = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._resize, daemon=True)
+        self._thread.start()
+
+    def due(self, now):
+        return now >= self._next_time
+
+    #a buffer shaped like the given image that is neither waiting nor being resized
+    def snapshot_buffer(self, like):
+        with self._lock:
+            return _free_buffer(self._buffers, like, (self._snapshot, self._resizing))
+
+    #the image must not be changed by the caller afterwards
+    def submit(self, image, now):
+        self._next_time = now + self._interval
+        with self._lock:
+            self._snapshot = image
+            self._lock.notify()
+
+    #shows the newest resized image, if there is one, and handles the window events.
+    #must be called from the thread that owns the HighGUI windows
+    def show(self):
+        with self._lock:
+            image, self._ready = self._ready, None
+            self._displaying = image
+        if image is None:
+            return
+        cv2.imshow(self._title, image)
+        self._shown = True
+        with self._lock:
+            self._displaying = None
+        if cv2.waitKey(1) & 0xFF == ESC_KEY:
+            self.closed = True
+
+    def _resize(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._snapshot is not None or not self._running)
+                if not self._running:
+                    break
+                image, self._snapshot = self._snapshot, None
+                self._resizing = image
+                display = _free_buffer(self._displays, self._display_like,
+                                       (self._ready, self._displaying))
+            cv2.resize(image, self._size, display)
+            with self._lock:
+                self._resizing = None
+                self._ready = display
+
+    def close(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        self._thread.join()
+        if self._shown:
+            cv2.destroyWindow(self._title)
@@ -0,0 +1,57 @@
+import struct
+
+#compact binary DIPPID messages, sent instead of json by DippidSink(wire_format="binary")
+#and recognized by SensorUDP on the first byte (json always starts with "{").
+#layout (26 bytes, little endian): magic, event type, value, sequence number,
+#capture time (time.monotonic() of the sender), x, y. the value is 32 bit because
+#touch messages carry the contact id, which keeps growing during a session
+BINARY_MAGIC= 0xD1
+MESSAGE= struct.Struct("<BBIIdff")
+SEQUENCE_MODULO= 2 ** 32
+
+MOVEMENT= 1
+TAP= 2
+TOUCH_DOWN= 3
+TOUCH_MOVE= 4
+TOUCH_UP= 5
+GESTURE= 6
+
+TOUCH_STATES= {TOUCH_DOWN: "down", TOUCH_MOVE: "move", TOUCH_UP: "up"}
+TOUCH_KINDS= {state: kind for kind, state in TOUCH_STATES.items()}
+#the value of a GESTURE message is the index in this tuple
+GESTURE_NAMES= ("tap", "double_tap", "long_press", "drag_start", "drag", "drag_end")
+
+
+def is_binary(data) -> bool:
+    return len(data) == MESSAGE.size and data[0] == BINARY_MAGIC
+
+
+def encode_message(kind, value, sequence, timestamp, x=0.0, y=0.0) -> bytes:
+    return MESSAGE.pack(BINARY_MAGIC, kind, value, sequence % SEQUENCE_MODULO,
+                        timestamp, x, y)
+
+
+#returns (capability, value, sequence, timestamp) with the same capability names and
+#values as the json messages, or None for unknown event types
+def decode_message(data):
+    _, kind, value, sequence, timestamp, x, y = MESSAGE.unpack(data)
+    if kind == MOVEMENT:
+        return "movement", {"x": x, "y": y}, sequence, timestamp
+    if kind == TAP:
+        return "tap", value, sequence, timestamp
+    if kind in TOUCH_STATES:
+        return ("touch", {"id": value, "state": TOUCH_STATES[kind], "x": x, "y": y},
+                sequence, timestamp)
+    if kind == GESTURE and value < len(GESTURE_NAMES):
+        return ("gesture", {"name": GESTURE_NAMES[value], "x": x, "y": y, "count": sequence},
+                sequence, timestamp)
+    return None
+
+
+#how many messages are missing between the last and this sequence number, or None if
+#this one is older than the last (reordered or duplicated)
+def sequence_gap(last, sequence):
+    difference = (sequence - last) % SEQUENCE_MODULO
+    if difference == 0 or difference >= SEQUENCE_MODULO // 2:
+        return None
+    return difference - 1
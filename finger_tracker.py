@@ -0,0 +1,480 @@
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from background_cache import background_matches, background_path, load_background, save_background
+from background_model import BackgroundModel
+from debug_preview import PREVIEW_MAX_FPS, DebugPreview
+from multitouch import MAX_MATCH_DISTANCE_FRACTION, ContactTracker, find_blobs
+from pointer_filter import make_pointer_filter
+from stage_timer import StageTimer, StatsReporter, draw_stage_overlay
+
+FRAME_WIDTH= 640
+FRAME_HEIGHT= 480
+TARGET_FPS= 30
+
+CALIBRATION_SECONDS= 3
+#auto exposure and white balance of a freshly opened camera, frames are skipped that long
+#before a full calibration
+CAMERA_SETTLE_SECONDS= 2
+#a stored background must match a live frame within this time, otherwise the camera is
+#calibrated again
+WARM_START_TIMEOUT_SECONDS= 0.5
+#the box edges are cut off, 10 % on every side
+CROP_FRACTION= 0.1
+
+#lowest per pixel threshold, noisy pixels get a higher one (see background_model.py)
+DARK_DIFF_THRESHOLD= 25
+MEAN_DARKNESS_MINIMUM= 20
+MIN_CONTOUR_AREA= 800
+MAX_CONTOUR_AREA= 5000
+#the contour areas above are meant for this frame width, they are scaled for others
+AREA_REFERENCE_WIDTH= 640
+BACKGROUND_LEARNING_RATE= 0.02
+
+PRESENCE_FRAMES_REQUIRED= 2
+ABSENCE_FRAMES_REQUIRED= 2
+TAP_DURATION_MAX_SECONDS= 0.35
+
+SMOOTHING_ALPHA= 0.5
+#"ema" (SMOOTHING_ALPHA above), "one_euro" or "kalman", see pointer_filter.py
+POINTER_FILTER= "ema"
+#exposure and usb transfer before the frame reaches the capture thread. cannot be
+#measured here, it is added to the measured pipeline latency for the prediction
+CAMERA_LATENCY_SECONDS= 0.03
+#weight of the newest frame in the running average of the pipeline latency
+LATENCY_AVERAGE_ALPHA= 0.1
+
+#blobs are searched on a copy of the image that is this many times smaller, only a small
+#window around the found blob is looked at in full resolution (1 = off)
+DETECTION_DOWNSCALE= 1
+#extra border around the blob for the full resolution window, in downscaled pixels
+REFINE_PADDING= 4
+
+
+#stages of one frame for the StageTimer: camera read, crop / resize / gray, difference
+#to the background, contours and centres, background update, sink callbacks (incl. the
+#UDP sends) and the debug image
+TRACKER_STAGES= ("read", "prepare", "difference", "contours", "background", "events",
+                 "preview")
+
+
+#position of the finger. x and y are normalized to 0..1 over the region of interest,
+#roi_x and roi_y are pixels in the region of interest (for drawing)
+@dataclass
+class TouchEvent:
+    x        : float
+    y        : float
+    roi_x    : float
+    roi_y    : float
+    timestamp: float
+    #finger counts as pressed (debounced with PRESENCE_FRAMES_REQUIRED)
+    down     : bool = False
+    #only set for touch up events
+    duration : float = 0.0
+    tap      : bool = False
+    #id of the contact in multi touch mode (on_contact_* callbacks)
+    contact_id: int = 0
+    #when the camera frame of this event arrived (capture.frame_time)
+    capture_time: float = 0.0
+
+
+#base class for everything that consumes tracker events. a sink only overrides the
+#callbacks it needs, the tracker calls them in this order every frame:
+#on_touch_down, on_touch_up / on_tap, on_move, on_contact_*, on_frame, draw
+class TrackerSink:
+    def on_touch_down(self, event: TouchEvent):
+        pass
+
+    def on_touch_up(self, event: TouchEvent):
+        pass
+
+    def on_tap(self, event: TouchEvent):
+        pass
+
+    def on_move(self, event: TouchEvent):
+        pass
+
+    #multi touch mode only: every contact with its own id. the single touch callbacks
+    #above keep following the largest blob
+    def on_contact_down(self, event: TouchEvent):
+        pass
+
+    def on_contact_move(self, event: TouchEvent):
+        pass
+
+    def on_contact_up(self, event: TouchEvent):
+        pass
+
+    def on_frame(self, now: float):
+        pass
+
+    #draws an overlay into the preview (region of interest, BGR)
+    def draw(self, roi, now: float):
+        pass
+
+    def close(self):
+        pass
+
+
+def calibrate_background(capture, seconds, top_crop, left_crop, mirror=False, show=True,
+                         clock=time.monotonic):
+    print("Kalibriere, Bitte nicht anfassen!")
+    #streaming sums, the memory does not grow with the calibration time
+    frame_count = 0
+    total = total_squares = None
+    calibration_start = clock()
+
+    while clock() - calibration_start < seconds:
+        ok, frame = capture.read()
+        if not ok:
+            continue
+        if mirror:
+            frame = cv2.flip(frame, 1)
+        region_of_interest = frame[top_crop:-top_crop, left_crop:-left_crop]
+        gray_roi = cv2.cvtColor(region_of_interest, cv2.COLOR_BGR2GRAY)
+        if total is None:
+            total = np.zeros(gray_roi.shape, np.float64)
+            total_squares = np.zeros(gray_roi.shape, np.float64)
+        cv2.accumulate(gray_roi, total)
+        cv2.accumulateSquare(gray_roi, total_squares)
+        frame_count += 1
+
+        if show:
+            cv2.imshow("Kalibriere...", region_of_interest)
+            cv2.waitKey(1)
+
+    if show and frame_count:
+        cv2.destroyWindow("Kalibriere...")
+    if frame_count == 0:
+        #camera delivered nothing or a recording ended before calibration
+        raise RuntimeError("Kalibrierung fehlgeschlagen: keine Kamerabilder erhalten")
+    #mean and variance of every pixel
+    mean = total / frame_count
+    variance = np.maximum(total_squares / frame_count - mean ** 2, 0)
+    return mean.astype(np.float32), variance.astype(np.float32)
+
+
+#one capture and detection loop for all outputs. finds the darkest finger sized blob
+#in front of the learned background, debounces touch down / up, tells taps from
+#strokes and hands the smoothed position to every sink.
+#without preview_title it runs headless and nothing is drawn at all, otherwise the
+#debug image is shown with at most preview_fps frames per second, resized on its own
+#thread.
+#timer measures every stage of the loop, stats_path / stats_port get its percentiles
+class FingerTracker:
+    def __init__(self, capture, sinks, mirror=False,
+                 preview_title=None, preview_size=(FRAME_WIDTH, FRAME_HEIGHT),
+                 frame_size=(FRAME_WIDTH, FRAME_HEIGHT),
+                 detection_downscale=DETECTION_DOWNSCALE, multi_touch=False,
+                 pointer_filter=POINTER_FILTER, preview_fps=PREVIEW_MAX_FPS,
+                 stats_path=None, stats_port=None):
+        self._capture = capture
+        #a replayed recording brings its own clock (frame_recording.ReplayCapture)
+        self._clock = getattr(capture, "clock", time.monotonic)
+        self.sinks = list(sinks)
+        #flip the camera image horizontally, so drawn letters are not mirrored
+        self._mirror = mirror
+        self._preview_title = preview_title
+        self._preview_size = preview_size
+        self._preview_fps = preview_fps
+        self._preview = None
+
+        self.timer = StageTimer(TRACKER_STAGES)
+        self._stats = None
+        if stats_path or stats_port:
+            self._stats = StatsReporter(stats_path, stats_port)
+
+        self._frame_size = frame_size
+        frame_width, frame_height = frame_size
+        self._crop_top_bottom = int(frame_height * CROP_FRACTION)
+        self._crop_left_right = int(frame_width * CROP_FRACTION)
+        self._roi_width = frame_width - 2 * self._crop_left_right
+        self._roi_height = frame_height - 2 * self._crop_top_bottom
+
+        self._downscale = max(1, int(detection_downscale))
+        self._detection_size = (self._roi_width // self._downscale,
+                                self._roi_height // self._downscale)
+        area_scale = (frame_width / AREA_REFERENCE_WIDTH / self._downscale) ** 2
+        self._min_contour_area = MIN_CONTOUR_AREA * area_scale
+        self._max_contour_area = MAX_CONTOUR_AREA * area_scale
+
+        #all blobs with stable ids instead of only the first one
+        self._contacts = None
+        if multi_touch:
+            self._contacts = ContactTracker(MAX_MATCH_DISTANCE_FRACTION * self._roi_width,
+                                            PRESENCE_FRAMES_REQUIRED, ABSENCE_FRAMES_REQUIRED,
+                                            SMOOTHING_ALPHA)
+
+        #working images of the frame loop, allocated once and filled with dst= every
+        #frame. if the camera delivers another size opencv returns new arrays instead
+        detection_width, detection_height = self._detection_size
+        self._roi_buffer = np.empty((self._roi_height, self._roi_width, 3), np.uint8)
+        self._small_buffer = np.empty((detection_height, detection_width, 3), np.uint8)
+        self._gray_buffer = np.empty((detection_height, detection_width), np.uint8)
+        self._labels_buffer = np.empty((detection_height, detection_width), np.int32)
+
+        self._background = None
+
+        self._pointer_filter = make_pointer_filter(pointer_filter, SMOOTHING_ALPHA)
+        #seconds from the camera frame to the sinks, averaged
+        self.pipeline_latency = 0.0
+        self._smoothed_x = self._smoothed_y = None
+        self._presence_frames = self._absence_frames = 0
+        self._finger_currently_down = False
+        self._finger_down_start_time = 0.0
+        self._last_event = None
+        self._frame_time = 0.0
+
+    def _skip_frames(self, seconds):
+        skip_end = self._clock() + seconds
+        while self._clock() < skip_end:
+            self._capture.read()
+
+    #true if a live frame fits the stored background, tried until the camera settled
+    #or WARM_START_TIMEOUT_SECONDS are over
+    def _background_still_valid(self, mean, variance):
+        deadline = self._clock() + WARM_START_TIMEOUT_SECONDS
+        while self._clock() < deadline:
+            ok, frame = self._capture.read()
+            if not ok:
+                continue
+            if self._mirror:
+                frame = cv2.flip(frame, 1)
+            roi = frame[self._crop_top_bottom:-self._crop_top_bottom,
+                        self._crop_left_right:-self._crop_left_right]
+            gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY).astype(np.float32)
+            if background_matches(mean, variance, gray_roi, DARK_DIFF_THRESHOLD):
+                return True
+        return False
+
+    #with use_cache the background is stored per camera (capture.device) and resolution
+    #and reused on the next start if it still fits, which skips settling and calibration
+    def calibrate(self, seconds=CALIBRATION_SECONDS, settle_seconds=CAMERA_SETTLE_SECONDS,
+                  use_cache=True):
+        camera = getattr(self._capture, "device", None)
+        cache_path = None
+        if use_cache and camera is not None:
+            cache_path = background_path(camera, self._frame_size, self._mirror)
+
+        stored = load_background(cache_path) if cache_path is not None else None
+        if stored is not None and self._background_still_valid(*stored):
+            print("Gespeicherte Kalibrierung verwendet")
+            mean, variance = stored
+        else:
+            self._skip_frames(settle_seconds)
+            mean, variance = calibrate_background(
+                self._capture, seconds, self._crop_top_bottom, self._crop_left_right,
+                self._mirror, show=self._preview_title is not None, clock=self._clock
+            )
+            if cache_path is not None:
+                save_background(cache_path, mean, variance)
+
+        if self._downscale > 1:
+            mean = cv2.resize(mean, self._detection_size, interpolation=cv2.INTER_AREA)
+            variance = cv2.resize(variance, self._detection_size, interpolation=cv2.INTER_AREA)
+        self._background = BackgroundModel(mean, variance, BACKGROUND_LEARNING_RATE,
+                                           DARK_DIFF_THRESHOLD)
+
+    #bounding box of the first finger sized and dark enough contour
+    def _find_finger(self, darkness_difference, finger_mask):
+        contours, _ = cv2.findContours(
+            finger_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if not (self._min_contour_area <= area <= self._max_contour_area):
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            if darkness_difference[y:y + h, x:x + w].mean() < MEAN_DARKNESS_MINIMUM:
+                continue
+            return x, y, w, h
+        return None
+
+    #the blob was found on the downscaled image, its centre is measured again in a
+    #full resolution window around it. background and thresholds of the window are
+    #upscaled from the downscaled background model
+    def _refine(self, roi, box):
+        k = self._downscale
+        x, y, w, h = box
+        x0 = max(0, x - REFINE_PADDING)
+        y0 = max(0, y - REFINE_PADDING)
+        x1 = min(self._detection_size[0], x + w + REFINE_PADDING)
+        y1 = min(self._detection_size[1], y + h + REFINE_PADDING)
+
+        window = cv2.cvtColor(roi[y0 * k:y1 * k, x0 * k:x1 * k], cv2.COLOR_BGR2GRAY)
+        window_size = (window.shape[1], window.shape[0])
+        background = cv2.resize(self._background.mean_uint8[y0:y1, x0:x1], window_size,
+                                interpolation=cv2.INTER_LINEAR)
+        threshold = cv2.resize(self._background.threshold_uint8[y0:y1, x0:x1], window_size,
+                               interpolation=cv2.INTER_LINEAR)
+        mask = cv2.compare(cv2.subtract(background, window), threshold, cv2.CMP_GT)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return (x + w / 2) * k, (y + h / 2) * k
+
+        bx, by, bw, bh = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        return x0 * k + bx + bw / 2, y0 * k + by + bh / 2
+
+    def _centre(self, roi, box):
+        if self._downscale > 1:
+            return self._refine(roi, box)
+        x, y, w, h = box
+        return x + w / 2, y + h / 2
+
+    def _event(self, roi_x, roi_y, now, **kwargs):
+        return TouchEvent(roi_x / self._roi_width, roi_y / self._roi_height,
+                          roi_x, roi_y, now, self._finger_currently_down,
+                          capture_time=self._frame_time, **kwargs)
+
+    #processes one frame, returns False once the preview window was closed with ESC
+    #or a recording is over
+    def step(self) -> bool:
+        timer = self.timer
+        timer.start_frame()
+        ok, frame = self._capture.read()
+        timer.mark("read")
+        if not ok:
+            return not getattr(self._capture, "finished", False)
+        now = self._clock()
+        #cameras without their own timestamps (e.g. a plain cv2.VideoCapture)
+        frame_time = getattr(self._capture, "frame_time", now)
+        self._frame_time = frame_time
+
+        roi = frame[self._crop_top_bottom:-self._crop_top_bottom,
+                    self._crop_left_right:-self._crop_left_right]
+        if self._mirror:
+            #the crop is the same on both sides, so only the region of interest is flipped
+            roi = cv2.flip(roi, 1, self._roi_buffer)
+        if self._downscale > 1:
+            #INTER_LINEAR is several times faster than INTER_AREA here and the
+            #finger blob is large enough that the skipped pixels do not matter
+            small_roi = cv2.resize(roi, self._detection_size, self._small_buffer,
+                                   interpolation=cv2.INTER_LINEAR)
+            gray_roi = cv2.cvtColor(small_roi, cv2.COLOR_BGR2GRAY, self._gray_buffer)
+        else:
+            gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, self._gray_buffer)
+        timer.mark("prepare")
+
+        darkness_difference, finger_mask = self._background.difference(gray_roi)
+        timer.mark("difference")
+        if self._contacts is None:
+            finger_boxes = [self._find_finger(darkness_difference, finger_mask)]
+            finger_boxes = [box for box in finger_boxes if box is not None]
+        else:
+            finger_boxes = find_blobs(finger_mask, darkness_difference,
+                                      self._min_contour_area, self._max_contour_area,
+                                      MEAN_DARKNESS_MINIMUM, self._labels_buffer)
+        centres = [self._centre(roi, box) for box in finger_boxes]
+        finger_present = bool(centres)
+        if finger_present:
+            centre_x, centre_y = centres[0]
+        timer.mark("contours")
+
+        if not finger_present:
+            self._background.update(gray_roi)
+        timer.mark("background")
+
+        self._presence_frames = self._presence_frames + 1 if finger_present else 0
+        self._absence_frames = self._absence_frames + 1 if not finger_present else 0
+
+        if (finger_present and
+                not self._finger_currently_down and
+                self._presence_frames >= PRESENCE_FRAMES_REQUIRED):
+            self._finger_currently_down = True
+            self._finger_down_start_time = now
+            down_event = self._event(centre_x, centre_y, now)
+            for sink in self.sinks:
+                sink.on_touch_down(down_event)
+
+        if (self._finger_currently_down and
+                self._absence_frames >= ABSENCE_FRAMES_REQUIRED):
+            self._finger_currently_down = False
+            duration = now - self._finger_down_start_time
+            last = self._last_event or self._event(0, 0, now)
+            up_event = self._event(last.roi_x, last.roi_y, now, duration=duration,
+                                   tap=duration <= TAP_DURATION_MAX_SECONDS)
+            for sink in self.sinks:
+                sink.on_touch_up(up_event)
+            self._pointer_filter.reset()
+            if up_event.tap:
+                for sink in self.sinks:
+                    sink.on_tap(up_event)
+
+        if finger_present:
+            latency = self._clock() - frame_time
+            self.pipeline_latency += LATENCY_AVERAGE_ALPHA * (latency - self.pipeline_latency)
+            self._smoothed_x, self._smoothed_y = self._pointer_filter.filter(
+                centre_x, centre_y, frame_time,
+                lead=self.pipeline_latency + CAMERA_LATENCY_SECONDS
+            )
+
+            self._last_event = self._event(self._smoothed_x, self._smoothed_y, now)
+            for sink in self.sinks:
+                sink.on_move(self._last_event)
+
+        if self._contacts is not None:
+            self._dispatch_contacts(centres, now)
+
+        for sink in self.sinks:
+            sink.on_frame(now)
+        timer.mark("events")
+
+        keep_running = True
+        if self._preview_title is not None:
+            if self._preview is None:
+                self._preview = DebugPreview(self._preview_title, self._preview_size,
+                                             self._preview_fps)
+            if self._preview.due(now):
+                self._preview.submit(self._draw_preview(roi, finger_present, now), now)
+            self._preview.show()
+            keep_running = not self._preview.closed
+            timer.mark("preview")
+
+        timer.end_frame()
+        if self._stats is not None:
+            self._stats.maybe_report(timer, now)
+        return keep_running
+
+    #the frame belongs to the camera ring buffer, so the overlays go on a copy in one
+    #of the preview's own buffers
+    def _draw_preview(self, roi, finger_present, now):
+        image = self._preview.snapshot_buffer(roi)
+        np.copyto(image, roi)
+        if finger_present:
+            cv2.circle(image, (int(self._smoothed_x), int(self._smoothed_y)),
+                       6, (0, 255, 0), -1)
+        if self._contacts is not None:
+            for contact in self._contacts.contacts:
+                if contact.confirmed:
+                    position = (int(contact.roi_x), int(contact.roi_y))
+                    cv2.circle(image, position, 10, (255, 255, 0), 2)
+                    cv2.putText(image, str(contact.id), position, cv2.FONT_HERSHEY_SIMPLEX,
+                                0.6, (255, 255, 0), 2)
+        for sink in self.sinks:
+            sink.draw(image, now)
+        draw_stage_overlay(image, self.timer)
+        return image
+
+    def _dispatch_contacts(self, centres, now):
+        for kind, contact in self._contacts.update(centres, now):
+            event = TouchEvent(contact.roi_x / self._roi_width, contact.roi_y / self._roi_height,
+                               contact.roi_x, contact.roi_y, now, kind != "up",
+                               duration=now - contact.down_time if kind == "up" else 0.0,
+                               contact_id=contact.id, capture_time=self._frame_time)
+            for sink in self.sinks:
+                getattr(sink, f"on_contact_{kind}")(event)
+
+    def run(self):
+        try:
+            while self.step():
+                pass
+        finally:
+            if self._preview is not None:
+                self._preview.close()
+            if self._stats is not None:
+                self._stats.close()
+            for sink in self.sinks:
+                sink.close()
@@ -1,12 +1,22 @@
+import asyncio
 import pyglet
 import math
 import sys
 import time
 import pandas as pd
-from DIPPID import SensorUDP
+from DIPPID import SensorAsyncUDP, SensorUDP
 
 PORT = 5700
-sensor = SensorUDP(PORT)
+# "python fitts_law.py 10 40 200 0 --threaded": SensorUDP with its own receiver thread
+# and pyglet.app.run(), the updates are queued and handled once per frame on the main
+# thread. without it the asyncio receiver in run_app() is used
+THREADED_SENSOR = "--threaded" in sys.argv[5:]
+if THREADED_SENSOR:
+    sensor = SensorUDP(PORT)
+    sensor.use_dispatch_queue()
+else:
+    # no receiver thread, packets are handled by the asyncio loop in run_app()
+    sensor = SensorAsyncUDP(PORT)
 
 NUM_TARGETS = int(sys.argv[1])
 TARGET_WIDTH = int(sys.argv[2])
@@ -20,6 +30,7 @@ COLOR_POINTER = (0, 255, 0)
 COLOR_POINTER_CLICK = (0, 0, 255)
 COLOR_TARGET_ACTIVE = (255, 0, 0)
 COLOR_TARGET_PASSIVE = (100, 100, 100)
+FRAME_SECONDS = 1 / 60
 
 
 window = pyglet.window.Window(WIDTH, HEIGHT, caption="Fitts Law Sample")
@@ -120,5 +131,31 @@ sensor.register_callback('movement', handle_movement)
 sensor.register_callback('tap', handle_tap)
 
 
+# pyglet's manual event loop as a coroutine instead of pyglet.app.run(): window events,
+# scheduled functions and drawing once per frame, while waiting in between asyncio handles
+# every DIPPID packet the moment it arrives (on this thread, so the callbacks never race
+# with on_draw)
+async def run_app():
+    await sensor.start()
+    try:
+        # the default on_close handler (X or ESC) sets has_exit
+        while not window.has_exit:
+            pyglet.clock.tick()
+            window.dispatch_events()
+            window.dispatch_event('on_draw')
+            window.flip()
+            await asyncio.sleep(FRAME_SECONDS)
+    finally:
+        sensor.disconnect()
+        window.close()
+
+
 fitts = FittsLaw(NUM_TARGETS, TARGET_WIDTH, TARGET_DISTANCE)
-pyglet.app.run()
\ No newline at end of file
+if THREADED_SENSOR:
+    pyglet.clock.schedule(sensor.dispatch_pending)
+    try:
+        pyglet.app.run()
+    finally:
+        sensor.disconnect()
+else:
+    asyncio.run(run_app())
\ No newline at end of file
@@ -0,0 +1,136 @@
+import json
+import math
+import struct
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+#file layout: magic line, one json header line, then per frame the capture time
+#(float64), the length of the zlib compressed pixels (uint32) and the pixels
+RECORDING_MAGIC= b"TOUCHREC1\n"
+FRAME_RECORD= struct.Struct("<dI")
+#fast and still about half the size of the raw pixels for camera images
+COMPRESSION_LEVEL= 1
+
+
+#wraps a capture and writes every frame it returns to path, everything else is passed
+#through. with gray=True only the gray image is stored, a third of the size, the
+#tracker only looks at gray values anyway
+class FrameRecorder:
+    def __init__(self, capture, path, gray=False):
+        self._capture = capture
+        self._gray = gray
+        self._file = open(path, "wb")
+        self._file.write(RECORDING_MAGIC)
+        self._header_written = False
+        self.recorded_frames = 0
+
+    def __getattr__(self, name):
+        return getattr(self._capture, name)
+
+    def read(self):
+        ok, frame = self._capture.read()
+        if not ok:
+            return ok, frame
+        frame_time = getattr(self._capture, "frame_time", time.monotonic())
+        pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if self._gray else frame
+        if not self._header_written:
+            height, width = pixels.shape[:2]
+            channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+            header = {"width": width, "height": height, "channels": channels}
+            self._file.write(json.dumps(header).encode() + b"\n")
+            self._header_written = True
+
+        data = zlib.compress(np.ascontiguousarray(pixels).data, COMPRESSION_LEVEL)
+        self._file.write(FRAME_RECORD.pack(frame_time, len(data)))
+        self._file.write(data)
+        self.recorded_frames += 1
+        return ok, frame
+
+    def release(self):
+        self._file.close()
+        self._capture.release()
+
+
+#plays a recording back like a camera (read, frame_time, release). realtime keeps the
+#recorded frame intervals, otherwise frames come as fast as the tracker takes them.
+#clock() is the time the tracker should use: in fast mode it is the recorded time of
+#the current frame, so taps, timeouts and filters behave as in the recording and two
+#replays log exactly the same event times. after the last frame finished is set and
+#clock() is infinite, which ends every wait
+class ReplayCapture:
+    def __init__(self, path, realtime=True):
+        self._file = open(path, "rb")
+        if self._file.readline() != RECORDING_MAGIC:
+            raise ValueError(f"{path} ist keine Aufnahme")
+        header_line = self._file.readline()
+        header = json.loads(header_line) if header_line else {"width": 0, "height": 0,
+                                                               "channels": 3}
+        self._shape = (header["height"], header["width"], header["channels"])
+        self._realtime = realtime
+        self._first_time = None
+        self._start_time = 0.0
+        #in fast mode the clock starts at the first recorded time, not at 0, so waits
+        #before the first frame (settling, calibration) last as long as in the recording
+        self.frame_time = self._peek_first_time()
+        self.finished = False
+        self.captured_frames = 0
+        self.dropped_frames = 0
+
+    def _peek_first_time(self):
+        position = self._file.tell()
+        record = self._file.read(FRAME_RECORD.size)
+        self._file.seek(position)
+        if len(record) < FRAME_RECORD.size:
+            return 0.0
+        return FRAME_RECORD.unpack(record)[0]
+
+    def clock(self):
+        if self.finished:
+            return math.inf
+        return time.monotonic() if self._realtime else self.frame_time
+
+    def read(self):
+        record = self._file.read(FRAME_RECORD.size)
+        if len(record) < FRAME_RECORD.size:
+            self.finished = True
+            return False, None
+        recorded_time, length = FRAME_RECORD.unpack(record)
+        data = self._file.read(length)
+        if len(data) < length:
+            #recording was cut off while writing
+            self.finished = True
+            return False, None
+
+        height, width, channels = self._shape
+        frame = np.frombuffer(bytearray(zlib.decompress(data)), np.uint8)
+        if channels == 1:
+            frame = cv2.cvtColor(frame.reshape(height, width), cv2.COLOR_GRAY2BGR)
+        else:
+            frame = frame.reshape(height, width, channels)
+
+        self.frame_time = recorded_time
+        if self._realtime:
+            #recorded times are moved to start now
+            if self._first_time is None:
+                self._first_time = recorded_time
+                self._start_time = time.monotonic()
+            self.frame_time = self._start_time + recorded_time - self._first_time
+            delay = self.frame_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.captured_frames += 1
+        return True, frame
+
+    def set(self, prop_id, value):
+        return False
+
+    def get(self, prop_id):
+        height, width, _ = self._shape
+        return {cv2.CAP_PROP_FRAME_WIDTH: width,
+                cv2.CAP_PROP_FRAME_HEIGHT: height}.get(prop_id, 0)
+
+    def release(self):
+        self._file.close()
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import cv2
+
+#three slots: the one the consumer is working on, the newest finished frame and the
+#one the camera thread is currently filling
+RING_SIZE= 3
+READ_TIMEOUT_SECONDS= 1.0
+
+
+#reads the camera on its own thread so a slow processing step never delays the next
+#grab and no stale frames queue up in the driver. read() always returns the newest
+#frame, frames that were overwritten before anybody read them are counted as dropped.
+#can be used like cv2.VideoCapture (read, set, get, release). frame_time is the
+#time.monotonic() at which the last returned frame arrived from the driver, a clock
+#change on the machine does not move it
+class ThreadedCapture:
+    def __init__(self, device=0, width=None, height=None, fps=None):
+        #identifies the camera, e.g. for the stored calibration
+        self.device = device
+        self._capture = cv2.VideoCapture(device)
+        if width:
+            self._capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self._capture.set(cv2.CAP_PROP_FPS, fps)
+
+        self._slots = [None] * RING_SIZE
+        self._slot_times = [0.0] * RING_SIZE
+        self.frame_time = 0.0
+        self._latest = -1
+        self._in_use = -1
+        self._frame_id = 0
+        self._consumed_id = 0
+        self.dropped_frames = 0
+        self.captured_frames = 0
+
+        self._lock = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._grab, daemon=True)
+        self._thread.start()
+
+    def _free_slot(self):
+        for i in range(RING_SIZE):
+            if i != self._latest and i != self._in_use:
+                return i
+
+    def _grab(self):
+        while self._running:
+            with self._lock:
+                slot = self._free_slot()
+            #the slot is neither handed out nor the newest frame, so it can be filled
+            #without holding the lock
+            ok, frame = self._capture.read(self._slots[slot])
+            frame_time = time.monotonic()
+            if not ok:
+                #no camera or a broken frame, do not spin at full speed
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                self._slots[slot] = frame
+                self._slot_times[slot] = frame_time
+                if self._frame_id > self._consumed_id:
+                    self.dropped_frames += 1
+                self._latest = slot
+                self._frame_id += 1
+                self.captured_frames += 1
+                self._lock.notify()
+
+    #returns the newest frame that has not been returned before, waiting for the
+    #camera if necessary. the frame stays valid until the next call of read()
+    def read(self):
+        with self._lock:
+            if not self._lock.wait_for(
+                    lambda: self._frame_id > self._consumed_id or not self._running,
+                    READ_TIMEOUT_SECONDS) or not self._running:
+                return False, None
+            self._in_use = self._latest
+            self._consumed_id = self._frame_id
+            self.frame_time = self._slot_times[self._in_use]
+            return True, self._slots[self._in_use]
+
+    def set(self, prop_id, value):
+        return self._capture.set(prop_id, value)
+
+    def get(self, prop_id):
+        return self._capture.get(prop_id)
+
+    def release(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        self._thread.join()
+        self._capture.release()
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import math
+
+from finger_tracker import TAP_DURATION_MAX_SECONDS, TrackerSink
+
+#a second tap that starts this soon after the first one ended is a double tap
+DOUBLE_TAP_SECONDS= 0.3
+#and may be this far away from it (normalized to the region of interest)
+DOUBLE_TAP_DISTANCE= 0.05
+LONG_PRESS_SECONDS= 0.6
+#a touch that moved further than this is a drag, not a tap or long press
+DRAG_START_DISTANCE= 0.03
+
+
+#callbacks that are due at a given time. nothing waits: whoever owns the queue calls
+#run_due(now) regularly (e.g. in on_frame), so a timer fires on the first frame after
+#its time and the frame loop never sleeps
+class TimerQueue:
+    def __init__(self):
+        self._heap = []
+        self._ids = itertools.count()
+        self._cancelled = set()
+
+    def __len__(self):
+        return len(self._heap) - len(self._cancelled)
+
+    #returns a handle for cancel()
+    def schedule(self, due_time, callback):
+        handle = next(self._ids)
+        heapq.heappush(self._heap, (due_time, handle, callback))
+        return handle
+
+    def cancel(self, handle):
+        if handle is not None and any(entry[1] == handle for entry in self._heap):
+            self._cancelled.add(handle)
+
+    def run_due(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            due_time, handle, callback = heapq.heappop(self._heap)
+            if handle in self._cancelled:
+                self._cancelled.discard(handle)
+                continue
+            callback(due_time)
+
+    #runs everything that is still waiting, e.g. before a socket is closed
+    def flush(self):
+        self.run_due(math.inf)
+
+
+def _distance(a, b):
+    return math.hypot(a.x - b.x, a.y - b.y)
+
+
+#turns the touch down / move / up of the tracker into tap, double_tap, long_press and
+#drag_start / drag / drag_end and passes them to its outputs (objects with an
+#on_gesture(name, event) method). a tap is reported right away, the double tap follows
+#on the second one, so single taps never wait for the double tap window
+class GestureRecognizer(TrackerSink):
+    def __init__(self, outputs):
+        self._outputs = list(outputs)
+        self._timers = TimerQueue()
+        self._down_event = None
+        self._last_move = None
+        self._dragging = False
+        self._long_pressed = False
+        self._long_press_timer = None
+        self._last_tap = None
+
+    def _emit(self, name, event):
+        for output in self._outputs:
+            output.on_gesture(name, event)
+
+    def on_touch_down(self, event):
+        self._down_event = self._last_move = event
+        self._dragging = False
+        self._long_pressed = False
+        self._long_press_timer = self._timers.schedule(
+            event.timestamp + LONG_PRESS_SECONDS, self._long_press
+        )
+
+    def _long_press(self, due_time):
+        self._long_press_timer = None
+        if self._down_event is not None and not self._dragging:
+            self._long_pressed = True
+            self._emit("long_press", self._last_move)
+
+    def on_move(self, event):
+        if self._down_event is None or not event.down:
+            return
+        self._last_move = event
+        if not self._dragging and _distance(event, self._down_event) > DRAG_START_DISTANCE:
+            self._dragging = True
+            self._timers.cancel(self._long_press_timer)
+            self._long_press_timer = None
+            self._emit("drag_start", self._down_event)
+        if self._dragging:
+            self._emit("drag", event)
+
+    def on_touch_up(self, event):
+        if self._down_event is None:
+            return
+        self._timers.cancel(self._long_press_timer)
+        self._long_press_timer = None
+        if self._dragging:
+            self._emit("drag_end", event)
+        elif not self._long_pressed and event.duration <= TAP_DURATION_MAX_SECONDS:
+            self._emit("tap", event)
+            last_tap = self._last_tap
+            if (last_tap is not None and
+                    self._down_event.timestamp - last_tap.timestamp <= DOUBLE_TAP_SECONDS and
+                    _distance(event, last_tap) <= DOUBLE_TAP_DISTANCE):
+                self._emit("double_tap", event)
+                #a third tap starts a new pair
+                self._last_tap = None
+            else:
+                self._last_tap = event
+        self._down_event = None
+
+    def on_frame(self, now):
+        self._timers.run_due(now)
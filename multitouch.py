@@ -0,0 +1,113 @@
+import itertools
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+MAX_CONTACTS= 10
+#a blob is only matched to a contact of the last frame if it moved less than this
+#fraction of the region of interest width
+MAX_MATCH_DISTANCE_FRACTION= 0.15
+
+
+#all dark blobs of the mask in one connected components pass, as (x, y, w, h) boxes,
+#largest first. blobs outside the area limits or not dark enough are skipped.
+#labels is an optional int32 buffer of the mask size for the label image
+def find_blobs(finger_mask, darkness_difference, min_area, max_area,
+               mean_darkness_minimum, labels=None) -> List[Tuple[int, int, int, int]]:
+    count, _, stats, _ = cv2.connectedComponentsWithStats(finger_mask, labels,
+                                                          connectivity=8, ltype=cv2.CV_32S)
+    #label 0 is the background
+    stats = stats[1:count]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    candidates = stats[(areas >= min_area) & (areas <= max_area)]
+    candidates = candidates[np.argsort(-candidates[:, cv2.CC_STAT_AREA])]
+
+    blobs = []
+    for x, y, w, h, _ in candidates:
+        if darkness_difference[y:y + h, x:x + w].mean() < mean_darkness_minimum:
+            continue
+        blobs.append((int(x), int(y), int(w), int(h)))
+        if len(blobs) == MAX_CONTACTS:
+            break
+    return blobs
+
+
+@dataclass
+class Contact:
+    id        : int
+    roi_x     : float
+    roi_y     : float
+    hits      : int = 1
+    misses    : int = 0
+    #reported to the sinks (seen in presence_frames frames in a row)
+    confirmed : bool = False
+    down_time : float = 0.0
+
+
+#gives every blob a stable id over the frames. blobs are assigned to the contacts of
+#the last frame greedily by distance, contacts are debounced like the single touch:
+#they go down after presence_frames and up after absence_frames frames
+class ContactTracker:
+    def __init__(self, max_match_distance, presence_frames, absence_frames,
+                 smoothing_alpha):
+        self._max_match_distance = max_match_distance
+        self._presence_frames = presence_frames
+        self._absence_frames = absence_frames
+        self._alpha = smoothing_alpha
+        self._ids = itertools.count(1)
+        self.contacts: List[Contact] = []
+
+    #takes the blob centres of this frame and returns the events as a list of
+    #("down" | "move" | "up", contact)
+    def update(self, centres: List[Tuple[float, float]], now: float):
+        events = []
+        matched_contacts = set()
+        matched_centres = set()
+
+        if self.contacts and centres:
+            old = np.array([(c.roi_x, c.roi_y) for c in self.contacts])
+            new = np.array(centres)
+            dists = np.linalg.norm(old[:, None] - new[None], axis=-1)
+            for flat in np.argsort(dists, axis=None):
+                ci, bi = divmod(int(flat), len(centres))
+                if dists[ci, bi] > self._max_match_distance:
+                    break
+                if ci in matched_contacts or bi in matched_centres:
+                    continue
+                matched_contacts.add(ci)
+                matched_centres.add(bi)
+
+                contact = self.contacts[ci]
+                contact.roi_x = self._alpha * centres[bi][0] + (1 - self._alpha) * contact.roi_x
+                contact.roi_y = self._alpha * centres[bi][1] + (1 - self._alpha) * contact.roi_y
+                contact.hits += 1
+                contact.misses = 0
+                if contact.confirmed:
+                    events.append(("move", contact))
+                elif contact.hits >= self._presence_frames:
+                    contact.confirmed = True
+                    contact.down_time = now
+                    events.append(("down", contact))
+
+        remaining = []
+        for ci, contact in enumerate(self.contacts):
+            if ci not in matched_contacts:
+                contact.misses += 1
+                if contact.misses >= self._absence_frames:
+                    if contact.confirmed:
+                        events.append(("up", contact))
+                    continue
+            remaining.append(contact)
+        self.contacts = remaining
+
+        for bi, (x, y) in enumerate(centres):
+            if bi not in matched_centres and len(self.contacts) < MAX_CONTACTS:
+                contact = Contact(next(self._ids), x, y)
+                if contact.hits >= self._presence_frames:
+                    contact.confirmed = True
+                    contact.down_time = now
+                    events.append(("down", contact))
+                self.contacts.append(contact)
+        return events
@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+#one euro filter (Casiez et al.): the cutoff frequency rises with the speed, so a
+#resting finger is smoothed strongly and a fast one gets almost no lag
+ONE_EURO_MIN_CUTOFF= 1.0
+ONE_EURO_BETA= 0.02
+ONE_EURO_DERIVATIVE_CUTOFF= 1.0
+
+#constant velocity kalman filter. process noise is the spectral density of the
+#acceleration in px^2/s^3, measurement noise the variance of the blob centre in px^2
+KALMAN_PROCESS_NOISE= 20000.0
+KALMAN_MEASUREMENT_NOISE= 4.0
+#the prediction never looks further ahead than this, whatever the measured latency
+MAX_PREDICTION_SECONDS= 0.1
+
+POINTER_FILTERS= ("ema", "one_euro", "kalman")
+
+
+#every filter takes the raw centre of one frame and returns the position to report.
+#lead is the latency in seconds the filter may predict ahead (only the kalman filter
+#does), reset() forgets the last touch.
+#this one is the fixed exponential moving average, the old smoothing
+class ExponentialFilter:
+    def __init__(self, alpha):
+        self._alpha = alpha
+        self._position = None
+
+    def reset(self):
+        self._position = None
+
+    def filter(self, x, y, timestamp, lead=0.0):
+        if self._position is None:
+            self._position = (x, y)
+        else:
+            px, py = self._position
+            self._position = (self._alpha * x + (1 - self._alpha) * px,
+                              self._alpha * y + (1 - self._alpha) * py)
+        return self._position
+
+
+def _smoothing_factor(dt, cutoff):
+    r = 2 * math.pi * cutoff * dt
+    return r / (r + 1)
+
+
+class OneEuroFilter:
+    def __init__(self, min_cutoff=ONE_EURO_MIN_CUTOFF, beta=ONE_EURO_BETA,
+                 derivative_cutoff=ONE_EURO_DERIVATIVE_CUTOFF):
+        self._min_cutoff = min_cutoff
+        self._beta = beta
+        self._derivative_cutoff = derivative_cutoff
+        self.reset()
+
+    def reset(self):
+        self._position = None
+        self._velocity = np.zeros(2)
+        self._last_time = 0.0
+
+    def filter(self, x, y, timestamp, lead=0.0):
+        measurement = np.array((x, y), dtype=np.float64)
+        dt = timestamp - self._last_time
+        if self._position is None or dt <= 0:
+            if self._position is None:
+                self._position = measurement
+            self._last_time = timestamp
+            return tuple(self._position)
+        self._last_time = timestamp
+
+        a = _smoothing_factor(dt, self._derivative_cutoff)
+        self._velocity = a * (measurement - self._position) / dt + (1 - a) * self._velocity
+        cutoff = self._min_cutoff + self._beta * np.linalg.norm(self._velocity)
+        a = _smoothing_factor(dt, cutoff)
+        self._position = a * measurement + (1 - a) * self._position
+        return tuple(self._position)
+
+
+#state is position and velocity per axis. both axes have the same noise, so they
+#share one 2x2 covariance matrix. the reported position is extrapolated by lead
+#seconds to make up for the time the frame spent in camera and pipeline. the
+#extrapolation amplifies the noise of the velocity, a one euro filter on the output
+#takes that jitter out again while the finger rests
+class KalmanPredictor:
+    def __init__(self, process_noise=KALMAN_PROCESS_NOISE,
+                 measurement_noise=KALMAN_MEASUREMENT_NOISE,
+                 max_prediction=MAX_PREDICTION_SECONDS):
+        self._q = process_noise
+        self._r = measurement_noise
+        self._max_prediction = max_prediction
+        self._output_filter = OneEuroFilter()
+        self.reset()
+
+    def reset(self):
+        self._output_filter.reset()
+        #rows: position, velocity; columns: x, y
+        self._state = None
+        self._covariance = None
+        self._last_time = 0.0
+
+    def filter(self, x, y, timestamp, lead=0.0):
+        measurement = np.array((x, y), dtype=np.float64)
+        if self._state is None:
+            self._state = np.array([measurement, (0.0, 0.0)])
+            #the first velocity is unknown, start with a wide spread
+            self._covariance = np.diag((self._r, 1e6))
+            self._last_time = timestamp
+            return self._output_filter.filter(x, y, timestamp)
+
+        dt = max(timestamp - self._last_time, 1e-3)
+        self._last_time = timestamp
+        transition = np.array(((1.0, dt), (0.0, 1.0)))
+        noise = self._q * np.array(((dt ** 3 / 3, dt ** 2 / 2), (dt ** 2 / 2, dt)))
+        self._state = transition @ self._state
+        self._covariance = transition @ self._covariance @ transition.T + noise
+
+        gain = self._covariance[:, 0] / (self._covariance[0, 0] + self._r)
+        self._state += np.outer(gain, measurement - self._state[0])
+        self._covariance -= np.outer(gain, self._covariance[0])
+
+        lead = min(max(lead, 0.0), self._max_prediction)
+        predicted = self._state[0] + lead * self._state[1]
+        return self._output_filter.filter(predicted[0], predicted[1], timestamp)
+
+
+#ema_alpha is only used by "ema" (the tracker passes its SMOOTHING_ALPHA)
+def make_pointer_filter(name, ema_alpha):
+    if name == "ema":
+        return ExponentialFilter(ema_alpha)
+    if name == "one_euro":
+        return OneEuroFilter()
+    if name == "kalman":
+        return KalmanPredictor()
+    raise ValueError(f"unknown pointer filter {name!r}, expected one of {POINTER_FILTERS}")
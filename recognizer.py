@@ -2,11 +2,16 @@
 from __future__ import annotations
 
 import math
-from dataclasses import dataclass
-from typing import List, Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List, Sequence, Tuple
 
+import numpy as np
 import pyglet
-from pyglet.window import mouse
+
+from template_index import TemplateIndex
 
 NUM_POINTS      = 64
 SQUARE_SIZE     = 250.0
@@ -17,162 +22,319 @@ ANGLE_RANGE     = math.radians(45.0)
 ANGLE_PRECISION = math.radians(2.0)
 PHI             = 0.5 * (-1.0 + math.sqrt(5.0))
 
-def _dist(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    return math.hypot(b[0] - a[0], b[1] - a[1])
-
-
-def _path_length(pts: List[Tuple[float, float]]) -> float:
-    return sum(_dist(pts[i - 1], pts[i]) for i in range(1, len(pts)))
-
-#converted to python from javascript from https://depts.washington.edu/acelab/proj/dollar/dollar.js
-def resample(points: List[Tuple[float, float]],
-             n: int = NUM_POINTS) -> List[Tuple[float, float]]:
-    if not points:
-        return []
-    total_length = _path_length(points)
-
-    if total_length == 0:
-        return [points[0] for _ in range(n)]
-    I = total_length / (n - 1)
-    D = 0.0
-    new_pts = [points[0]]
-    pts = list(points)
-    i = 1
-    while i < len(pts) and len(new_pts) < n:
-        d = _dist(pts[i - 1], pts[i])
-        if (D + d) >= I:
-            t  = (I - D) / d
-            qx = pts[i - 1][0] + t * (pts[i][0] - pts[i - 1][0])
-            qy = pts[i - 1][1] + t * (pts[i][1] - pts[i - 1][1])
-            q  = (qx, qy)
-            new_pts.append(q)
-            pts.insert(i, q)
-            D = 0.0
-            i += 1
-        else:
-            D += d
-            i += 1
-
-    while len(new_pts) < n:
-        new_pts.append(pts[-1])
-    return new_pts
-
-def centroid(pts: List[Tuple[float, float]]) -> Tuple[float, float]:
-    x = sum(p[0] for p in pts) / len(pts)
-    y = sum(p[1] for p in pts) / len(pts)
-    return x, y
-
-
-def indicative_angle(pts: List[Tuple[float, float]]) -> float:
+#all steps work on (N, 2) float arrays, lists of (x, y) tuples are converted on entry
+def _as_array(points: Sequence[Tuple[float, float]]) -> np.ndarray:
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def _path_length(pts: np.ndarray) -> float:
+    return float(np.hypot(*np.diff(pts, axis=0).T).sum())
+
+#same result as the javascript version, but interpolates all points at once over the
+#cumulative arc length instead of inserting into the list (which was quadratic)
+def resample(points: Sequence[Tuple[float, float]],
+             n: int = NUM_POINTS) -> np.ndarray:
+    pts = _as_array(points)
+    if len(pts) == 0:
+        return pts
+    arc = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(pts, axis=0).T))))
+    return resample_along(pts, arc, n)
+
+
+#resample for points whose cumulative arc length is already known,
+#StrokeSession keeps it up to date while the stroke is drawn
+def resample_along(pts: np.ndarray, arc: np.ndarray,
+                   n: int = NUM_POINTS) -> np.ndarray:
+    if arc[-1] == 0:
+        return np.repeat(pts[:1], n, axis=0)
+
+    #drop points that did not move so the arc length is strictly increasing for np.interp
+    moving = np.concatenate(([True], np.diff(arc) > 0))
+    pts = pts[moving]
+    arc = arc[moving]
+    targets = np.linspace(0.0, arc[-1], n)
+    return np.column_stack((np.interp(targets, arc, pts[:, 0]),
+                            np.interp(targets, arc, pts[:, 1])))
+
+def centroid(pts: np.ndarray) -> np.ndarray:
+    return pts.mean(axis=0)
+
+
+def indicative_angle(pts: np.ndarray) -> float:
     c = centroid(pts)
     return math.atan2(c[1] - pts[0][1], c[0] - pts[0][0])
 
 
-def rotate_by(pts: List[Tuple[float, float]], rad: float
-             ) -> List[Tuple[float, float]]:
+def rotate_by(pts: np.ndarray, rad: float) -> np.ndarray:
+    return _rotate_many(pts, np.array([rad]))[0]
+
+
+#rotates the same stroke by several angles at once -> (len(rads), N, 2)
+def _rotate_many(pts: np.ndarray, rads: np.ndarray) -> np.ndarray:
     c = centroid(pts)
-    cos_r, sin_r = math.cos(rad), math.sin(rad)
-    def _rot(p):
-        dx, dy = p[0] - c[0], p[1] - c[1]
-        return (dx * cos_r - dy * sin_r + c[0],
-                dx * sin_r + dy * cos_r + c[1])
-    return [_rot(p) for p in pts]
+    dx = pts[:, 0] - c[0]
+    dy = pts[:, 1] - c[1]
+    cos_r = np.cos(rads)[:, None]
+    sin_r = np.sin(rads)[:, None]
+    return np.stack((dx * cos_r - dy * sin_r + c[0],
+                     dx * sin_r + dy * cos_r + c[1]), axis=-1)
 
-def _bounding_box(pts: List[Tuple[float, float]]
-                 ) -> Tuple[float, float, float, float]:
-    xs, ys = zip(*pts)
-    return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+def _bounding_box(pts: np.ndarray) -> Tuple[float, float, float, float]:
+    lo = pts.min(axis=0)
+    hi = pts.max(axis=0)
+    return lo[0], lo[1], hi[0] - lo[0], hi[1] - lo[1]
 
 
-def scale_to(pts: List[Tuple[float, float]],
-             size: float = SQUARE_SIZE) -> List[Tuple[float, float]]:
+def scale_to(pts: np.ndarray, size: float = SQUARE_SIZE) -> np.ndarray:
     _, _, w, h = _bounding_box(pts)
     w = w or 1.0
     h = h or 1.0
-    return [(p[0] * (size / w), p[1] * (size / h)) for p in pts]
+    return pts * (size / w, size / h)
 
 
-def translate_to(pts: List[Tuple[float, float]],
-                 target: Tuple[float, float] = ORIGIN
-                ) -> List[Tuple[float, float]]:
-    c = centroid(pts)
-    return [(p[0] + target[0] - c[0], p[1] + target[1] - c[1]) for p in pts]
+def translate_to(pts: np.ndarray,
+                 target: Tuple[float, float] = ORIGIN) -> np.ndarray:
+    return pts + (np.asarray(target) - centroid(pts))
 
-def _path_distance(a: List[Tuple[float, float]],
-                   b: List[Tuple[float, float]]) -> float:
-    return sum(_dist(p, q) for p, q in zip(a, b)) / len(a)
+#works for single strokes (N, 2) and for stacks (T, N, 2) -> one distance per stroke
+def _path_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(a - b, axis=-1).mean(axis=-1)
 
 
-def _distance_at_angle(pts: List[Tuple[float, float]],
-                       tmpl_pts: List[Tuple[float, float]],
+def _distance_at_angle(pts: np.ndarray, tmpl_pts: np.ndarray,
                        rad: float) -> float:
-    return _path_distance(rotate_by(pts, rad), tmpl_pts)
+    return float(_path_distance(rotate_by(pts, rad), tmpl_pts))
+
+
+def distance_at_best_angle(pts: np.ndarray, tmpl_pts: np.ndarray,
+                           a: float, b: float, thresh: float) -> float:
+    return float(distances_at_best_angle(pts, tmpl_pts[None], a, b, thresh)[0])
 
 
-def distance_at_best_angle(pts: List[Tuple[float, float]],
-                           tmpl_pts: List[Tuple[float, float]],
-                           a: float, b: float,
-                           thresh: float) -> float:
+#golden section search for all templates in lockstep. the interval shrinks by PHI in
+#every step no matter which side is kept, so all templates need the same number of steps
+def distances_at_best_angle(pts: np.ndarray, tmpl_stack: np.ndarray,
+                            a: float, b: float, thresh: float) -> np.ndarray:
+    count = len(tmpl_stack)
+    a = np.full(count, a)
+    b = np.full(count, b)
     x1 = PHI * a + (1 - PHI) * b
-    f1 = _distance_at_angle(pts, tmpl_pts, x1)
+    f1 = _path_distance(_rotate_many(pts, x1), tmpl_stack)
     x2 = (1 - PHI) * a + PHI * b
-    f2 = _distance_at_angle(pts, tmpl_pts, x2)
-    while abs(b - a) > thresh:
-        if f1 < f2:
-            b, x2, f2 = x2, x1, f1
-            x1 = PHI * a + (1 - PHI) * b
-            f1 = _distance_at_angle(pts, tmpl_pts, x1)
-        else:
-            a, x1, f1 = x1, x2, f2
-            x2 = (1 - PHI) * a + PHI * b
-            f2 = _distance_at_angle(pts, tmpl_pts, x2)
-    return min(f1, f2)
+    f2 = _path_distance(_rotate_many(pts, x2), tmpl_stack)
+    while abs(b[0] - a[0]) > thresh:
+        left = f1 < f2
+        a, b = np.where(left, a, x1), np.where(left, x2, b)
+        x1, x2 = (np.where(left, PHI * a + (1 - PHI) * b, x2),
+                  np.where(left, x1, (1 - PHI) * a + PHI * b))
+        #only the new probe point of every template needs a fresh distance
+        fresh = _path_distance(_rotate_many(pts, np.where(left, x1, x2)),
+                               tmpl_stack)
+        f1, f2 = np.where(left, fresh, f2), np.where(left, f1, fresh)
+    return np.minimum(f1, f2)
+
+
+#protractor style: the rotation that best aligns the candidate with a template follows
+#in closed form from two dot products, so every template only needs one rotation.
+#the angle is clamped to [a, b] like in the golden section search and the distance is
+#measured the same way, which keeps the scores on the $1 scale
+def distances_at_closed_form_angle(pts: np.ndarray, tmpl_stack: np.ndarray,
+                                   a: float, b: float) -> np.ndarray:
+    c = centroid(pts)
+    dx = pts[:, 0] - c[0]
+    dy = pts[:, 1] - c[1]
+    tx = tmpl_stack[..., 0]
+    ty = tmpl_stack[..., 1]
+    dot   = tx @ dx + ty @ dy
+    cross = ty @ dx - tx @ dy
+    best_rads = np.clip(np.arctan2(cross, dot), a, b)
+    return _path_distance(_rotate_many(pts, best_rads), tmpl_stack)
+
+
+#distance of every point to the centroid. rotating around the centroid keeps these
+#distances, so the mean difference of two profiles is a lower bound for the path
+#distance of the strokes at every angle
+def radius_profile(pts: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(pts - pts.mean(axis=-2, keepdims=True), axis=-1)
+
+
+def preprocess(points: Sequence[Tuple[float, float]]) -> np.ndarray:
+    return normalize(resample(points))
+
+
+#everything of preprocess() after the resampling step
+def normalize(pts: np.ndarray) -> np.ndarray:
+    pts = rotate_by(pts, -indicative_angle(pts))
+    pts = scale_to(pts)
+    pts = translate_to(pts)
+    return pts
 
 @dataclass
 class Template:
     name      : str
     raw_points: List[Tuple[float, float]]
-    points    : List[Tuple[float, float]] = None
+    points    : np.ndarray = None
 
     def __post_init__(self):
-        pts = resample(self.raw_points)
-        pts = rotate_by(pts, -indicative_angle(pts))
-        pts = scale_to(pts)
-        pts = translate_to(pts)
-        self.points = pts
+        #templates loaded from the cache already come preprocessed
+        if self.points is None:
+            self.points = preprocess(self.raw_points)
 
 
 @dataclass
 class Result:
     name : str
     score: float
+    #best match per template name, best first (filled by recognize(..., n_best=N))
+    n_best: List["Result"] = field(default_factory=list)
+
+#templates are matched in chunks ordered by their lower bound, chunks that can not
+#beat the current n-th best distance are skipped
+PRUNE_CHUNK_SIZE = 32
+
+#strokes per task sent to a worker process by recognize_many
+BATCH_CHUNK_SIZE = 64
+
+#recognizer of the current worker process, set once by _init_worker
+_worker_recognizer = None
+
+
+def _init_worker(recognizer: "DollarRecognizer"):
+    global _worker_recognizer
+    _worker_recognizer = recognizer
+
+
+def _recognize_in_worker(points: List[Tuple[float, float]], n_best: int) -> Result:
+    return _worker_recognizer.recognize(points, n_best)
 
 class DollarRecognizer:
-    def __init__(self, window_h: int):
+    def __init__(self, window_h: int, protractor: bool = False,
+                 index_slack: float = 0.0):
         self.templates: List[Template] = []
         self._win_h = window_h
+        #closed form angle matching instead of the golden section search
+        self._protractor = protractor
+        #0 finds the exact best match, with s > 0 the search may stop early and the
+        #returned distance is at most (1 + s) times the best one
+        self._index_slack = index_slack
+        #(T, NUM_POINTS, 2) stack of all template points, rebuilt lazily after add_template
+        self._template_stack: np.ndarray = None
+        #radius profiles of all templates, hands out templates in lower bound order
+        self._index = TemplateIndex()
+        #index into self._names for every template
+        self._name_ids: np.ndarray = None
+        self._names: List[str] = []
+
+    def _invalidate(self):
+        self._template_stack = None
+        self._name_ids = None
 
     def add_template(self, name: str, pts: List[Tuple[float, float]]):
-        self.templates.append(Template(name, pts))
-
-    def recognize(self, points: List[Tuple[float, float]]) -> Result:
-        #reverse y for pyglet window since it measures from bottom
-        points = [(x, self._win_h - y) for (x, y) in points]
-
-        candidate = Template("", points)
-
-        best_dist = float("inf")
-        best_name = "No match"
-        for tmpl in self.templates:
-            d = distance_at_best_angle(candidate.points, tmpl.points,
+        tmpl = Template(name, pts)
+        self.templates.append(tmpl)
+        self._index.add(radius_profile(tmpl.points))
+        self._invalidate()
+
+    #adds templates whose points already went through preprocess(), e.g. from
+    #template_cache. if the recognizer is empty the given (T, NUM_POINTS, 2) array is
+    #used as stack directly, so a memory mapped cache is shared instead of copied
+    def add_preprocessed_templates(self, names: List[str], points: np.ndarray,
+                                   raw_points: List[Sequence[Tuple[float, float]]]):
+        was_empty = not self.templates
+        for name, pts, raw in zip(names, points, raw_points):
+            self.templates.append(Template(name, raw, pts))
+        self._index.add(radius_profile(np.asarray(points)))
+        self._invalidate()
+        if was_empty:
+            self._template_stack = points
+
+    @property
+    def template_stack(self) -> np.ndarray:
+        if self._template_stack is None:
+            self._template_stack = np.stack(
+                [t.points for t in self.templates]
+            ) if self.templates else np.empty((0, NUM_POINTS, 2))
+        return self._template_stack
+
+    @property
+    def name_ids(self) -> np.ndarray:
+        if self._name_ids is None:
+            names, ids = np.unique([t.name for t in self.templates],
+                                   return_inverse=True)
+            self._names = [str(name) for name in names]
+            self._name_ids = ids.reshape(-1)
+        return self._name_ids
+
+    def _distances(self, pts: np.ndarray, tmpl_stack: np.ndarray) -> np.ndarray:
+        if self._protractor:
+            return distances_at_closed_form_angle(pts, tmpl_stack,
+                                                  -ANGLE_RANGE, ANGLE_RANGE)
+        return distances_at_best_angle(pts, tmpl_stack,
                                        -ANGLE_RANGE, ANGLE_RANGE,
                                        ANGLE_PRECISION)
-            if d < best_dist:
-                best_dist = d
-                best_name = tmpl.name
 
-        score = 1.0 - best_dist / HALF_DIAGONAL
-        return Result(best_name, score)
+    #templates come out of the index in order of their lower bound and are matched in
+    #chunks, the search stops once no remaining template can beat the n-th best letter.
+    #returns the best distance per template name, names that were pruned stay inf
+    def _match(self, pts: np.ndarray, n_best: int) -> np.ndarray:
+        stack = self.template_stack
+        name_ids = self.name_ids
+        slack = 1.0 + self._index_slack
+
+        name_dists = np.full(len(self._names), np.inf)
+        n_best = min(n_best, len(name_dists))
+        cutoff = np.inf
+        chunk = []
+
+        def match_chunk():
+            nonlocal cutoff
+            ids = np.concatenate(chunk)
+            chunk.clear()
+            np.minimum.at(name_dists, name_ids[ids], self._distances(pts, stack[ids]))
+            cutoff = np.partition(name_dists, n_best - 1)[n_best - 1]
+
+        for bound, bounds, ids in self._index.search(radius_profile(pts)):
+            if bound * slack >= cutoff:
+                break
+            chunk.append(ids[bounds * slack < cutoff])
+            if sum(len(ids) for ids in chunk) >= PRUNE_CHUNK_SIZE:
+                match_chunk()
+        if chunk:
+            match_chunk()
+        return name_dists
+
+    def recognize(self, points: List[Tuple[float, float]],
+                  n_best: int = 1) -> Result:
+        return self.recognize_resampled(resample(points), n_best)
+
+    #recognize() for a stroke that already went through resample()
+    def recognize_resampled(self, resampled: np.ndarray,
+                            n_best: int = 1) -> Result:
+        if not self.templates:
+            return Result("No match", float("-inf"))
+
+        #reverse y for pyglet window since it measures from bottom
+        candidate = normalize(resampled * (1, -1) + (0, self._win_h))
+        name_dists = self._match(candidate, max(1, n_best))
+        ranked = np.argsort(name_dists, kind="stable")[:max(1, n_best)]
+        results = [Result(self._names[i], float(1.0 - name_dists[i] / HALF_DIAGONAL))
+                   for i in ranked if np.isfinite(name_dists[i])]
+        best = results[0]
+        return Result(best.name, best.score, results)
+
+    #recognizes many recorded strokes on a process pool, e.g. to re-score an archive after
+    #changing templates or RECOGNITION_THRESHOLD. the templates are sent to every worker
+    #once when it starts, the results come back in the order of strokes
+    def recognize_many(self, strokes: Sequence[List[Tuple[float, float]]],
+                       n_best: int = 1, workers: int = None) -> List[Result]:
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(strokes) <= BATCH_CHUNK_SIZE:
+            return [self.recognize(points, n_best) for points in strokes]
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self,)) as pool:
+            return list(pool.map(partial(_recognize_in_worker, n_best=n_best),
+                                 strokes, chunksize=BATCH_CHUNK_SIZE))
 
 gesture_points = {
     "rectangle": [
@@ -225,58 +387,64 @@ WINDOW_W, WINDOW_H = 1600, 900
 LINE_W= 5
 
 
-class GestureWindow(pyglet.window.Window):
-    def __init__(self):
-        super().__init__(WINDOW_W, WINDOW_H, "$1 Gesture Recognizer", resizable=False)
-        pyglet.gl.glLineWidth(LINE_W)
-
-        self.recogniser = DollarRecognizer(window_h=self.height)
-        for name, pts in gesture_points.items():
-            self.recogniser.add_template(name, pts)
-
-        self.points: List[Tuple[float, float]] = []
-        self.lines : List[pyglet.shapes.Line]  = []
-        self.batch  = pyglet.graphics.Batch()
-        self.label  = pyglet.text.Label(
-            "Draw a Gesture (Rectangle, Circle, Check, Delete, Pigtail)",
-            x=10, y=self.height - 34, batch=self.batch, font_size=23
-        )
-
-    def _wipe(self):
-        for l in self.lines:
-            l.delete()
-        self.lines.clear()
-        self.points.clear()
-
-    def on_mouse_press(self, x, y, button, modifiers):
-        if button == mouse.LEFT:
-            self._wipe()
-            self.points.append((x, y))
-            self.label.text = "Drawing..."
-
-    def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
-        if buttons & mouse.LEFT:
-            last = self.points[-1]
-            self.points.append((x, y))
-            self.lines.append(
-                pyglet.shapes.Line(last[0], last[1], x, y, LINE_W,
-                                   color=(60, 190, 255), batch=self.batch)
+#the demo window is only created on demand, importing pyglet.window needs a display
+#and the recognizer itself also runs on headless machines (touch box, benchmarks)
+def run_demo():
+    from pyglet.window import mouse
+
+    class GestureWindow(pyglet.window.Window):
+        def __init__(self):
+            super().__init__(WINDOW_W, WINDOW_H, "$1 Gesture Recognizer", resizable=False)
+            pyglet.gl.glLineWidth(LINE_W)
+
+            self.recogniser = DollarRecognizer(window_h=self.height)
+            for name, pts in gesture_points.items():
+                self.recogniser.add_template(name, pts)
+
+            self.points: List[Tuple[float, float]] = []
+            self.lines : List[pyglet.shapes.Line]  = []
+            self.batch  = pyglet.graphics.Batch()
+            self.label  = pyglet.text.Label(
+                "Draw a Gesture (Rectangle, Circle, Check, Delete, Pigtail)",
+                x=10, y=self.height - 34, batch=self.batch, font_size=23
             )
 
-    def on_mouse_release(self, x, y, button, modifiers):
-        if button == mouse.LEFT and len(self.points) > 10:
-            res = self.recogniser.recognize(self.points)
-            if(res.score < 0.8):
-                res.name = "No match"
-            self.label.text = f"{res.name} (score = {res.score:.2f})"
+        def _wipe(self):
+            for l in self.lines:
+                l.delete()
+            self.lines.clear()
             self.points.clear()
 
-    def on_draw(self):
-        self.clear()
-        self.batch.draw()
+        def on_mouse_press(self, x, y, button, modifiers):
+            if button == mouse.LEFT:
+                self._wipe()
+                self.points.append((x, y))
+                self.label.text = "Drawing..."
+
+        def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
+            if buttons & mouse.LEFT:
+                last = self.points[-1]
+                self.points.append((x, y))
+                self.lines.append(
+                    pyglet.shapes.Line(last[0], last[1], x, y, LINE_W,
+                                       color=(60, 190, 255), batch=self.batch)
+                )
+
+        def on_mouse_release(self, x, y, button, modifiers):
+            if button == mouse.LEFT and len(self.points) > 10:
+                res = self.recogniser.recognize(self.points)
+                if(res.score < 0.8):
+                    res.name = "No match"
+                self.label.text = f"{res.name} (score = {res.score:.2f})"
+                self.points.clear()
+
+        def on_draw(self):
+            self.clear()
+            self.batch.draw()
 
+    GestureWindow()
+    pyglet.app.run()
 
 
 if __name__ == "__main__":
-    GestureWindow()
-    pyglet.app.run()
\ No newline at end of file
+    run_demo()
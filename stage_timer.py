@@ -0,0 +1,102 @@
+import json
+import socket
+import time
+
+import cv2
+import numpy as np
+
+#the percentiles are computed over this many of the newest frames
+STATS_HISTORY_FRAMES= 512
+#how often StatsReporter writes the percentiles
+STATS_INTERVAL_SECONDS= 5.0
+STATS_UDP_IP_ADDRESS= "127.0.0.1"
+STATS_PERCENTILES= (50, 99)
+
+
+#time per stage of the frame loop. every frame is one column of a preallocated ring
+#buffer, mark(stage) adds the time since the last mark to that stage, so one frame
+#costs a few perf_counter calls and array writes and it can stay on all the time.
+#the stage "total" is the whole frame
+class StageTimer:
+    def __init__(self, stages, history=STATS_HISTORY_FRAMES):
+        self.stages = list(stages) + ["total"]
+        self._index = {name: i for i, name in enumerate(self.stages)}
+        self._samples = np.zeros((len(self.stages), history))
+        self._frame_starts = np.zeros(history)
+        self._history = history
+        self._position = 0
+        self._count = 0
+        self._frame_start = self._last_mark = 0.0
+
+    def start_frame(self):
+        self._frame_start = self._last_mark = time.perf_counter()
+        self._samples[:, self._position] = 0.0
+
+    def mark(self, stage):
+        mark_time = time.perf_counter()
+        self._samples[self._index[stage], self._position] += mark_time - self._last_mark
+        self._last_mark = mark_time
+
+    #frames that are not ended (e.g. no camera image) are overwritten by the next one
+    def end_frame(self):
+        position = self._position
+        self._samples[-1, position] = time.perf_counter() - self._frame_start
+        self._frame_starts[position] = self._frame_start
+        self._position = (position + 1) % self._history
+        self._count = min(self._count + 1, self._history)
+
+    def fps(self):
+        if self._count < 2:
+            return 0.0
+        starts = self._frame_starts[:self._count]
+        span = starts.max() - starts.min()
+        return (self._count - 1) / span if span > 0 else 0.0
+
+    #{stage: [milliseconds per percentile]}
+    def percentiles(self, percentiles=STATS_PERCENTILES):
+        if not self._count:
+            return {name: [0.0] * len(percentiles) for name in self.stages}
+        values = np.percentile(self._samples[:, :self._count] * 1000, percentiles, axis=1)
+        return {name: values[:, i].tolist() for i, name in enumerate(self.stages)}
+
+
+#FPS and the median milliseconds of every stage, top right of the debug image
+def draw_stage_overlay(image, timer):
+    lines = [f"FPS {timer.fps():.1f}"]
+    lines += [f"{name} {ms[0]:.1f} ms" for name, ms in timer.percentiles((50,)).items()]
+    x = image.shape[1] - 170
+    for i, line in enumerate(lines):
+        cv2.putText(image, line, (x, 20 + 18 * i), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, (0, 255, 255), 1, cv2.LINE_AA)
+
+
+#writes p50 / p99 of every stage as one json line every interval seconds, appended to
+#a file and / or sent to a local UDP port
+class StatsReporter:
+    def __init__(self, path=None, port=None, interval=STATS_INTERVAL_SECONDS):
+        self._file = open(path, "a", buffering=1) if path else None
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if port else None
+        self._address = (STATS_UDP_IP_ADDRESS, port)
+        self._interval = interval
+        self._next_time = None
+
+    def maybe_report(self, timer, now):
+        if self._next_time is None:
+            self._next_time = now + self._interval
+        if now < self._next_time:
+            return
+        self._next_time = now + self._interval
+
+        stages = {name: {f"p{p}_ms": round(ms, 3) for p, ms in zip(STATS_PERCENTILES, values)}
+                  for name, values in timer.percentiles().items()}
+        line = json.dumps({"time": now, "fps": round(timer.fps(), 2), "stages": stages})
+        if self._file is not None:
+            self._file.write(line + "\n")
+        if self._socket is not None:
+            self._socket.sendto(line.encode(), self._address)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._socket is not None:
+            self._socket.close()
@@ -0,0 +1,108 @@
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+import recognizer as recognizer_module
+
+#start size of the point buffer, it doubles whenever a stroke gets longer
+INITIAL_CAPACITY= 256
+
+
+#collects the points of one stroke while it is drawn and recognizes it speculatively.
+#the cumulative arc length is updated with every point, so resampling the stroke is a
+#single interpolation. a worker thread re-scores the current stroke whenever new points
+#arrived, so when the finger lifts the result for the complete stroke is usually
+#already there and finish() only has to return it. without a recognizer the session
+#only collects points
+class StrokeSession:
+    def __init__(self, recognizer, min_points: int = 1):
+        self._recognizer = recognizer
+        self._min_points = min_points
+
+        self._points = np.empty((INITIAL_CAPACITY, 2))
+        self._arc = np.empty(INITIAL_CAPACITY)
+        self._count = 0
+
+        #result of the speculative run and the number of points it was computed from
+        self._result = None
+        self._result_count = 0
+        self._generation = 0
+
+        self._lock = threading.Condition()
+        self._running = True
+        self._worker = None
+        if recognizer is not None:
+            self._worker = threading.Thread(target=self._speculate, daemon=True)
+            self._worker.start()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def points(self) -> np.ndarray:
+        with self._lock:
+            return self._points[:self._count].copy()
+
+    def reset(self):
+        with self._lock:
+            self._count = 0
+            self._result = None
+            self._result_count = 0
+            #results of a run that started before the reset are thrown away
+            self._generation += 1
+
+    def add_point(self, point: Tuple[float, float]):
+        with self._lock:
+            if self._count == len(self._points):
+                self._points = np.concatenate((self._points, np.empty_like(self._points)))
+                self._arc = np.concatenate((self._arc, np.empty_like(self._arc)))
+
+            i = self._count
+            self._points[i] = point
+            self._arc[i] = (0.0 if i == 0 else
+                            self._arc[i - 1] + np.hypot(*(self._points[i] - self._points[i - 1])))
+            self._count += 1
+            if self._count >= self._min_points:
+                self._lock.notify()
+
+    #returns the result for all points added so far, computing it only if the
+    #worker has not caught up yet
+    def finish(self) -> Optional[recognizer_module.Result]:
+        with self._lock:
+            if self._recognizer is None or self._count < self._min_points:
+                return None
+            if self._result_count == self._count:
+                return self._result
+            snapshot = self._snapshot()
+        return self._recognizer.recognize_resampled(snapshot)
+
+    def close(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        if self._worker is not None:
+            self._worker.join()
+
+    def _snapshot(self) -> np.ndarray:
+        return recognizer_module.resample_along(self._points[:self._count],
+                                                self._arc[:self._count])
+
+    def _speculate(self):
+        while True:
+            with self._lock:
+                while self._running and (self._count < self._min_points or
+                                         self._result_count == self._count):
+                    self._lock.wait()
+                if not self._running:
+                    return
+                count = self._count
+                generation = self._generation
+                snapshot = self._snapshot()
+
+            result = self._recognizer.recognize_resampled(snapshot)
+
+            with self._lock:
+                if generation == self._generation:
+                    self._result = result
+                    self._result_count = count
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+import recognizer as recognizer_module
+
+#the preprocessed templates are stored next to the xml files as plain .npy arrays,
+#so they can be opened with a memory map and several processes share the same pages
+CACHE_DIR_NAME= ".cache"
+INDEX_FILE= "index.json"
+POINTS_FILE= "points.npy"
+RAW_FILE= "raw_points.npy"
+RAW_OFFSETS_FILE= "raw_offsets.npy"
+
+
+def read_template(xml_path: Path):
+    root = ET.parse(xml_path).getroot()
+    tmpl_name = root.attrib.get("Name", xml_path.stem).strip().lower()
+    tmpl_points = [
+        (float(pt.attrib["X"]), float(pt.attrib["Y"]))
+        for pt in root.iter("Point")
+    ]
+    return tmpl_name, tmpl_points
+
+
+#multi stroke templates ($P format) group their points in <Stroke> elements,
+#files without them are read as a single stroke
+def read_template_strokes(xml_path: Path):
+    root = ET.parse(xml_path).getroot()
+    tmpl_name = root.attrib.get("Name", xml_path.stem).strip().lower()
+    stroke_elements = list(root.iter("Stroke")) or [root]
+    tmpl_strokes = [
+        [(float(pt.attrib["X"]), float(pt.attrib["Y"])) for pt in stroke.iter("Point")]
+        for stroke in stroke_elements
+    ]
+    return tmpl_name, tmpl_strokes
+
+
+#fingerprint of the template set: file names, sizes and mtimes plus the preprocessing
+#constants, a changed, added or removed xml file (or a changed NUM_POINTS) invalidates the cache
+def template_signature(xml_files: List[Path]) -> str:
+    sha = hashlib.sha1()
+    sha.update(f"{recognizer_module.NUM_POINTS}:{recognizer_module.SQUARE_SIZE}".encode())
+    for xml_file in xml_files:
+        stat = xml_file.stat()
+        sha.update(f"|{xml_file.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return sha.hexdigest()
+
+
+def _load_cache(cache_dir: Path, signature: str):
+    try:
+        index = json.loads((cache_dir / INDEX_FILE).read_text())
+        if index.get("signature") != signature:
+            return None
+        points = np.load(cache_dir / POINTS_FILE, mmap_mode="r")
+        raw = np.load(cache_dir / RAW_FILE, mmap_mode="r")
+        offsets = np.load(cache_dir / RAW_OFFSETS_FILE)
+    except (OSError, ValueError):
+        return None
+    names = index["names"]
+    if len(names) != len(points) or len(offsets) != len(names) + 1:
+        return None
+    raw_points = [raw[offsets[i]:offsets[i + 1]] for i in range(len(names))]
+    return names, points, raw_points
+
+
+def _write_cache(cache_dir: Path, signature: str, names, points, raw_points):
+    cache_dir.mkdir(exist_ok= True)
+    offsets = np.cumsum([0] + [len(pts) for pts in raw_points])
+    raw = (np.concatenate([np.asarray(pts, np.float64).reshape(-1, 2)
+                           for pts in raw_points])
+           if raw_points else np.empty((0, 2)))
+
+    #write to temporary files and swap them in, the index goes last so a reader
+    #never sees a signature that belongs to half written arrays
+    for file_name, array in ((POINTS_FILE, points),
+                             (RAW_FILE, raw),
+                             (RAW_OFFSETS_FILE, offsets)):
+        tmp_path = cache_dir / f"{file_name}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            np.save(tmp_file, array)
+        os.replace(tmp_path, cache_dir / file_name)
+
+    tmp_index = cache_dir / f"{INDEX_FILE}.{os.getpid()}.tmp"
+    tmp_index.write_text(json.dumps({"signature": signature, "names": names}))
+    os.replace(tmp_index, cache_dir / INDEX_FILE)
+
+
+def load_templates(template_dir: Path):
+    """Returns (names, points, raw_points) for all xml templates in template_dir.
+
+    points is a read only (T, NUM_POINTS, 2) memory map of the preprocessed templates.
+    The xml files are only parsed again if one of them changed since the cache was written.
+    """
+    xml_files = sorted(template_dir.glob("*.xml"))
+    signature = template_signature(xml_files)
+    cache_dir = template_dir / CACHE_DIR_NAME
+
+    cached = _load_cache(cache_dir, signature)
+    if cached is not None:
+        return cached
+
+    names, raw_points = [], []
+    for xml_file in xml_files:
+        name, points = read_template(xml_file)
+        names.append(name)
+        raw_points.append(points)
+    points = (np.stack([recognizer_module.preprocess(pts) for pts in raw_points])
+              if raw_points
+              else np.empty((0, recognizer_module.NUM_POINTS, 2)))
+
+    try:
+        _write_cache(cache_dir, signature, names, points, raw_points)
+    except OSError as error:
+        print("Template-Cache konnte nicht geschrieben werden:", error)
+        return names, points, raw_points
+
+    cached = _load_cache(cache_dir, signature)
+    return cached if cached is not None else (names, points, raw_points)
@@ -0,0 +1,90 @@
+import heapq
+import itertools
+from typing import Iterator, Tuple
+
+import numpy as np
+
+#templates per leaf, a leaf is scored with one vectorized operation
+LEAF_SIZE= 32
+#templates added after the last build are kept in a plain list, the tree is rebuilt
+#once there are more of them than REBUILD_FRACTION of the indexed templates
+REBUILD_FRACTION= 0.25
+
+
+#mean absolute difference between radius profiles. it is a metric (scaled L1), so the
+#triangle inequality holds and the tree can skip whole subtrees
+def profile_distance(profiles: np.ndarray, query: np.ndarray) -> np.ndarray:
+    return np.abs(profiles - query).mean(axis=-1)
+
+
+#vantage point tree over the radius profiles of the templates (distance of every
+#resampled point to the centroid). the profile does not change when a stroke is
+#rotated, and profile_distance() is a lower bound of the $1 path distance at every
+#angle, so the tree can hand out the templates in order of that bound
+class TemplateIndex:
+    def __init__(self, leaf_size: int = LEAF_SIZE):
+        self._leaf_size = leaf_size
+        self._profiles = np.empty((0, 0))
+        self._count = 0
+        self._root = None
+        self._indexed = 0
+
+    def __len__(self):
+        return self._count
+
+    #adding is an append, the tree itself is only rebuilt lazily by search()
+    def add(self, profiles: np.ndarray):
+        profiles = np.atleast_2d(profiles)
+        needed = self._count + len(profiles)
+        if needed > len(self._profiles):
+            grown = np.empty((max(needed, 2 * len(self._profiles), 64), profiles.shape[1]))
+            if self._count:
+                grown[:self._count] = self._profiles[:self._count]
+            self._profiles = grown
+        self._profiles[self._count:needed] = profiles
+        self._count = needed
+
+    def _build(self, ids: np.ndarray):
+        if len(ids) <= self._leaf_size:
+            return ids
+        vantage = ids[0]
+        dists = profile_distance(self._profiles[ids], self._profiles[vantage])
+        radius = float(np.median(dists))
+        inside = dists <= radius
+        #many identical profiles, splitting would not help
+        if inside.all():
+            return ids
+        return (vantage, radius, self._build(ids[inside]), self._build(ids[~inside]))
+
+    def _rebuild_if_needed(self):
+        pending = self._count - self._indexed
+        if self._root is None or pending > max(self._leaf_size,
+                                               REBUILD_FRACTION * self._indexed):
+            self._root = self._build(np.arange(self._count))
+            self._indexed = self._count
+
+    #yields (bound, bounds, ids) with non decreasing bound, where bounds are the
+    #profile distances of the templates ids and bound is at most their minimum.
+    #everything yielded later has a profile distance of at least bound, so the caller
+    #can stop as soon as bound can not beat its current best match
+    def search(self, query: np.ndarray) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        self._rebuild_if_needed()
+        tie = itertools.count()
+        heap = [(0.0, next(tie), self._root, None)]
+        if self._indexed < self._count:
+            heap.append((0.0, next(tie), np.arange(self._indexed, self._count), None))
+
+        while heap:
+            bound, _, node, bounds = heapq.heappop(heap)
+            if bounds is not None:
+                yield bound, bounds, node
+            elif isinstance(node, np.ndarray):
+                if len(node):
+                    bounds = profile_distance(self._profiles[node], query)
+                    heapq.heappush(heap, (max(bound, float(bounds.min())), next(tie),
+                                          node, bounds))
+            else:
+                vantage, radius, inside, outside = node
+                dist = float(profile_distance(self._profiles[vantage], query))
+                heapq.heappush(heap, (max(bound, dist - radius), next(tie), inside, None))
+                heapq.heappush(heap, (max(bound, radius - dist), next(tie), outside, None))
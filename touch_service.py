@@ -0,0 +1,104 @@
+#runs one camera and detection loop and feeds several outputs at once, e.g.
+#python touch_service.py --dippid --letters --log events.csv
+import argparse
+import time
+
+import cv2
+
+from finger_tracker import FRAME_HEIGHT, FRAME_WIDTH, POINTER_FILTER, TARGET_FPS, FingerTracker
+from frame_recording import FrameRecorder, ReplayCapture
+from frame_source import ThreadedCapture
+from gestures import GestureRecognizer
+from pointer_filter import POINTER_FILTERS
+from tracker_sinks import DRAW_WINDOW_SIZE, DippidSink, EventLogSink, KeyboardOutput, LetterSink
+import touch_input_with_recognizer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description= "Touch-Box mit mehreren Ausgaben")
+    parser.add_argument("--dippid", action= "store_true",
+                        help= "pointer and taps as DIPPID over UDP")
+    parser.add_argument("--letters", action= "store_true",
+                        help= "recognize letters and type them")
+    parser.add_argument("--multi-touch", action= "store_true",
+                        help= "track up to 10 contacts and send them as DIPPID 'touch' events")
+    parser.add_argument("--filter", choices= POINTER_FILTERS, default= POINTER_FILTER,
+                        help= "smoothing of the pointer, kalman predicts ahead by the latency")
+    parser.add_argument("--gestures", action= "store_true",
+                        help= "also send double tap, long press and drag as DIPPID 'gesture' events")
+    parser.add_argument("--binary", action= "store_true",
+                        help= "send DIPPID as compact binary messages with sequence numbers")
+    parser.add_argument("--log", help= "append all touch events to this csv file")
+    parser.add_argument("--recalibrate", action= "store_true",
+                        help= "ignore the stored calibration of the camera")
+    parser.add_argument("--record", metavar= "PATH",
+                        help= "save all camera frames with their times to this file")
+    parser.add_argument("--record-gray", action= "store_true",
+                        help= "only save the gray image (a third of the size)")
+    parser.add_argument("--replay", metavar= "PATH",
+                        help= "read the frames from a recording instead of the camera")
+    parser.add_argument("--fast", action= "store_true",
+                        help= "replay as fast as possible instead of in real time")
+    parser.add_argument("--stats", metavar= "PATH",
+                        help= "append p50/p99 per stage of the camera loop every 5 s to this file")
+    parser.add_argument("--stats-port", type= int,
+                        help= "send the same stats as json to this local UDP port")
+    parser.add_argument("--headless", action= "store_true",
+                        help= "no preview window, nothing is drawn")
+    args = parser.parse_args()
+
+    sinks = []
+    if args.letters:
+        recognizer = touch_input_with_recognizer.build_gesture_recognizer(DRAW_WINDOW_SIZE)
+        sinks.append(LetterSink(recognizer, [KeyboardOutput()]))
+    if args.dippid:
+        #the image is mirrored for the letters, the pointer keeps the camera orientation
+        dippid_sink = DippidSink(mirror_x= args.letters, multi_touch= args.multi_touch,
+                                 wire_format= "binary" if args.binary else "json")
+        sinks.append(dippid_sink)
+        if args.gestures:
+            sinks.append(GestureRecognizer([dippid_sink]))
+    if args.log:
+        sinks.append(EventLogSink(args.log))
+    if not sinks:
+        parser.error("mindestens eine Ausgabe angeben (--dippid, --letters, --log)")
+
+    if args.replay:
+        camera_capture = ReplayCapture(args.replay, realtime= not args.fast)
+    else:
+        camera_capture = ThreadedCapture(0, FRAME_WIDTH, FRAME_HEIGHT, TARGET_FPS)
+    if args.record:
+        camera_capture = FrameRecorder(camera_capture, args.record, gray= args.record_gray)
+    tracker = FingerTracker(
+        camera_capture,
+        sinks,
+        mirror= args.letters,
+        multi_touch= args.multi_touch,
+        pointer_filter= args.filter,
+        preview_title= None if args.headless else "touch_service.py | ESC to exit",
+        preview_size= (FRAME_WIDTH, FRAME_HEIGHT),
+        stats_path= args.stats,
+        stats_port= args.stats_port,
+    )
+    #recordings calibrate from their own first frames, so a replay sees the same
+    #background as the recorded run
+    use_cache = not (args.recalibrate or args.record or args.replay)
+    tracker.calibrate(use_cache= use_cache)
+
+    start_frames = camera_capture.captured_frames
+    start_time = time.perf_counter()
+    try:
+        tracker.run()
+    finally:
+        if args.replay:
+            seconds = time.perf_counter() - start_time
+            frames = camera_capture.captured_frames - start_frames
+            print(f"{frames} Frames in {seconds:.2f} s ({frames / max(seconds, 1e-9):.0f} fps)")
+        print("Verworfene Frames:", camera_capture.dropped_frames,
+              "von", camera_capture.captured_frames)
+        camera_capture.release()
+        cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import itertools
+import json
+import socket
+
+import cv2
+import numpy as np
+
+import dippid_wire
+from finger_tracker import TrackerSink
+from gestures import TimerQueue
+from stroke_session import StrokeSession
+
+UDP_IP_ADDRESS= "127.0.0.1"
+UDP_PORT_NUMBER= 5700
+FITTS_WINDOW_SIZE= 800
+TAP_RESET_SECONDS= 0.04
+TAP_TEXT_DURATION_SECONDS= 1.0
+
+DRAW_WINDOW_SIZE= 1000
+RECOGNITION_THRESHOLD= 0.74
+MIN_POINTS_PER_LETTER= 12
+SKIP_FRAMES_AFTER_PRESS= 2
+FAIL_TEXT_DURATION_SECONDS= 2.5
+LETTER_TEXT_DURATION_SECONDS= 2.0
+
+#multi stroke letters with the point cloud recognizer: strokes that start within
+#STROKE_GROUP_TIMEOUT_SECONDS after the last one ended belong to the same letter.
+#while such a letter is open, short strokes (crossbars) count as strokes, not as taps
+STROKE_GROUP_TIMEOUT_SECONDS= 0.6
+CLOUD_RECOGNITION_THRESHOLD= 0.7
+MIN_POINTS_PER_STROKE= 2
+
+
+def _scale(value, size):
+    return int(np.clip(value * size, 0, size))
+
+
+#sends the pointer position and taps as DIPPID json over UDP (e.g. to fitts_law.py).
+#{"tap": 0} follows TAP_RESET_SECONDS after {"tap": 1} from the timer queue, the frame
+#loop does not wait for it. as output of a GestureRecognizer it also sends
+#{"gesture": {"name", "x", "y", "count"}}, count makes repeated gestures differ.
+#wire_format="binary" sends the same events as 26 byte messages with sequence number
+#and capture time instead (dippid_wire.py), SensorUDP understands both
+class DippidSink(TrackerSink):
+    def __init__(self, ip=UDP_IP_ADDRESS, port=UDP_PORT_NUMBER,
+                 window_size=FITTS_WINDOW_SIZE, mirror_x=False, multi_touch=False,
+                 wire_format="json"):
+        self._address = (ip, port)
+        self._window_size = window_size
+        #undo a mirrored tracker image, e.g. when running together with the letters
+        self._mirror_x = mirror_x
+        #additionally send every contact as {"touch": {"id", "state", "x", "y"}}
+        self._multi_touch = multi_touch
+        if wire_format not in ("json", "binary"):
+            raise ValueError(f"unknown wire format {wire_format!r}")
+        self._binary = wire_format == "binary"
+        self._sequence = itertools.count()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self._last_sent_coordinates = (0, 0)
+        self._last_tap_time = -1.0
+        self._last_tap_coordinates = (0, 0)
+        self._timers = TimerQueue()
+        self._gesture_count = itertools.count(1)
+
+    #message is the json version, the rest is only needed for the binary one
+    def _send(self, message, kind, value, timestamp, x=0, y=0):
+        if self._binary:
+            data = dippid_wire.encode_message(kind, value, next(self._sequence),
+                                              timestamp, x, y)
+        else:
+            data = json.dumps(message).encode()
+        self._socket.sendto(data, self._address)
+
+    def _scaled(self, event):
+        x = 1 - event.x if self._mirror_x else event.x
+        return _scale(x, self._window_size), _scale(event.y, self._window_size)
+
+    def on_move(self, event):
+        scaled_x, scaled_y = self._scaled(event)
+        self._last_sent_coordinates = (scaled_x, scaled_y)
+        self._send({"movement": {"x": scaled_x, "y": scaled_y}},
+                   dippid_wire.MOVEMENT, 0, event.capture_time, scaled_x, scaled_y)
+
+    def _send_contact(self, state, event):
+        if self._multi_touch:
+            scaled_x, scaled_y = self._scaled(event)
+            self._send({"touch": {"id": event.contact_id, "state": state,
+                                  "x": scaled_x, "y": scaled_y}},
+                       dippid_wire.TOUCH_KINDS[state], event.contact_id, event.capture_time,
+                       scaled_x, scaled_y)
+
+    def on_contact_down(self, event):
+        self._send_contact("down", event)
+
+    def on_contact_move(self, event):
+        self._send_contact("move", event)
+
+    def on_contact_up(self, event):
+        self._send_contact("up", event)
+
+    def _send_tap(self, value, event, coordinates):
+        self._send({"tap": value}, dippid_wire.TAP, value, event.capture_time, *coordinates)
+
+    def on_tap(self, event):
+        coordinates = self._last_sent_coordinates
+        self._send_tap(1, event, coordinates)
+        self._timers.schedule(event.timestamp + TAP_RESET_SECONDS,
+                              lambda due_time: self._send_tap(0, event, coordinates))
+        self._last_tap_time = event.timestamp
+        self._last_tap_coordinates = coordinates
+
+    def on_gesture(self, name, event):
+        scaled_x, scaled_y = self._scaled(event)
+        self._send({"gesture": {"name": name, "x": scaled_x, "y": scaled_y,
+                                "count": next(self._gesture_count)}},
+                   dippid_wire.GESTURE, dippid_wire.GESTURE_NAMES.index(name),
+                   event.capture_time, scaled_x, scaled_y)
+
+    def on_frame(self, now):
+        self._timers.run_due(now)
+
+    def draw(self, roi, now):
+        if now - self._last_tap_time < TAP_TEXT_DURATION_SECONDS:
+            cv2.putText(
+                roi,
+                f"Tap ({self._last_tap_coordinates[0]}, {self._last_tap_coordinates[1]})",
+                (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.9,
+                (0, 0, 255),
+                2,
+                cv2.LINE_AA
+            )
+
+    def close(self):
+        #a pending {"tap": 0} still goes out
+        self._timers.flush()
+        self._socket.close()
+
+
+#types recognized letters with pynput
+class KeyboardOutput:
+    def __init__(self):
+        #imported here, pynput needs a desktop session which the other outputs do not
+        from pynput.keyboard import Controller
+        self._keyboard_controller = Controller()
+
+    def on_letter(self, letter, score):
+        self._keyboard_controller.press(letter)
+        self._keyboard_controller.release(letter)
+
+
+#collects strokes, recognizes letters and passes them to its outputs
+#(objects with an on_letter(letter, score) method, e.g. KeyboardOutput)
+class LetterSink(TrackerSink):
+    def __init__(self, recognizer, outputs, cloud_recognizer=None,
+                 draw_size=DRAW_WINDOW_SIZE):
+        self._outputs = list(outputs)
+        self._cloud_recognizer = cloud_recognizer
+        self._draw_size = draw_size
+
+        #speculative $1 recognition is only useful for single stroke letters
+        self._stroke_session = StrokeSession(
+            None if cloud_recognizer else recognizer, MIN_POINTS_PER_LETTER
+        )
+        self._frames_since_down = 0
+        self._gesture_strokes = []
+        self._last_stroke_end_time = 0.0
+        self._finger_down = False
+        self._draw_points = []
+        self.spelled_chars = []
+
+        self._last_letter = ""
+        self._last_score = 0.0
+        self._last_letter_time = 0.0
+
+        self._fail_guess = ""
+        self._fail_score = 0.0
+        self._last_fail_time = 0.0
+
+    def on_touch_down(self, event):
+        self._finger_down = True
+        self._frames_since_down = 0
+        self._stroke_session.reset()
+        self._draw_points.clear()
+
+    def on_move(self, event):
+        if not event.down:
+            return
+        self._frames_since_down += 1
+        if self._frames_since_down > SKIP_FRAMES_AFTER_PRESS:
+            self._stroke_session.add_point((_scale(event.x, self._draw_size),
+                                            _scale(event.y, self._draw_size)))
+            self._draw_points.append((int(event.roi_x), int(event.roi_y)))
+
+    def on_touch_up(self, event):
+        self._finger_down = False
+        if self._cloud_recognizer is not None:
+            if ((not event.tap or self._gesture_strokes) and
+                    len(self._stroke_session) >= MIN_POINTS_PER_STROKE):
+                self._gesture_strokes.append(self._stroke_session.points)
+                self._last_stroke_end_time = event.timestamp
+        elif not event.tap:
+            #usually already computed in the background while drawing
+            self._handle_result(self._stroke_session.finish(), event.timestamp)
+        self._stroke_session.reset()
+        self._draw_points.clear()
+
+    def on_frame(self, now):
+        if (self._gesture_strokes and not self._finger_down and
+                now - self._last_stroke_end_time >= STROKE_GROUP_TIMEOUT_SECONDS):
+            points_in_gesture = sum(len(stroke) for stroke in self._gesture_strokes)
+            if points_in_gesture >= MIN_POINTS_PER_LETTER:
+                self._handle_result(
+                    self._cloud_recognizer.recognize(self._gesture_strokes), now
+                )
+            self._gesture_strokes.clear()
+
+    def _handle_result(self, res, now):
+        if res is None:
+            return
+        threshold = (CLOUD_RECOGNITION_THRESHOLD if self._cloud_recognizer is not None
+                     else RECOGNITION_THRESHOLD)
+        if res.score >= threshold:
+            key = res.name.lower()
+            self.spelled_chars.append(key)
+            for output in self._outputs:
+                output.on_letter(key, res.score)
+
+            self._last_letter = key
+            self._last_score = res.score
+            self._last_letter_time = now
+        else:
+            self._fail_guess = res.name
+            self._fail_score = res.score
+            self._last_fail_time = now
+
+    def draw(self, roi, now):
+        if len(self._draw_points) >= 2:
+            cv2.polylines(roi, [np.array(self._draw_points, np.int32)],
+                          False, (255, 0, 0), 2)
+
+        spelled_word = "".join(self.spelled_chars).upper()
+        cv2.putText(roi,
+                    f"Spelled word: {spelled_word}",
+                    (10, 25),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.8,
+                    (255, 255, 255),
+                    2)
+
+        if now - self._last_fail_time < FAIL_TEXT_DURATION_SECONDS:
+            cv2.putText(
+                roi,
+                f"No valid letter (best guess: {self._fail_guess.upper()} "
+                f"{self._fail_score * 100:.0f}%)",
+                (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.74,
+                (0, 20, 255),
+                2,
+            )
+        elif self._last_letter and now - self._last_letter_time < LETTER_TEXT_DURATION_SECONDS:
+            cv2.putText(
+                roi,
+                f"Letter: {self._last_letter.upper()} "
+                f"({self._last_score * 100:.0f}% certainty)",
+                (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.9,
+                (255, 200, 0),
+                2,
+            )
+
+    def close(self):
+        self._stroke_session.close()
+
+
+#writes every tracker event as a csv line (time, event, x, y), x and y normalized
+class EventLogSink(TrackerSink):
+    def __init__(self, path):
+        self._file = open(path, "a", buffering=1)
+
+    def _write(self, name, event):
+        self._file.write(f"{event.timestamp:.4f},{name},{event.x:.4f},{event.y:.4f}\n")
+
+    def on_touch_down(self, event):
+        self._write("down", event)
+
+    def on_touch_up(self, event):
+        self._write("up", event)
+
+    def on_tap(self, event):
+        self._write("tap", event)
+
+    def on_move(self, event):
+        self._write("move", event)
+
+    def close(self):
+        self._file.close()